@@ -15,13 +15,68 @@ class Settings:
     QDRANT_HOST: str = os.getenv("QDRANT_HOST", "localhost")
     QDRANT_PORT: int = int(os.getenv("QDRANT_PORT", "6333"))
     QDRANT_COLLECTION_NAME: str = os.getenv("QDRANT_COLLECTION_NAME", "obuda_phonebook")
+    # Optional embedded Qdrant instead of a server: ":memory:" or a local directory path
+    QDRANT_LOCATION: str = os.getenv("QDRANT_LOCATION", "")
+    # Store each Company (faculty) in its own collection and route queries to it
+    QDRANT_SHARD_BY_COMPANY: bool = os.getenv("QDRANT_SHARD_BY_COMPANY", "false").lower() in ("1", "true", "yes")
+    QDRANT_FANOUT_WORKERS: int = int(os.getenv("QDRANT_FANOUT_WORKERS", "8"))
+    # Bulk upload: batches in flight, adaptive batch size bounds, retries
+    QDRANT_UPLOAD_PARALLELISM: int = int(os.getenv("QDRANT_UPLOAD_PARALLELISM", "4"))
+    QDRANT_UPLOAD_BATCH_SIZE: int = int(os.getenv("QDRANT_UPLOAD_BATCH_SIZE", "128"))
+    QDRANT_UPLOAD_MIN_BATCH: int = int(os.getenv("QDRANT_UPLOAD_MIN_BATCH", "16"))
+    QDRANT_UPLOAD_MAX_BATCH: int = int(os.getenv("QDRANT_UPLOAD_MAX_BATCH", "256"))
+    QDRANT_UPLOAD_TARGET_LATENCY: float = float(os.getenv("QDRANT_UPLOAD_TARGET_LATENCY", "1.0"))
+    QDRANT_UPLOAD_MAX_RETRIES: int = int(os.getenv("QDRANT_UPLOAD_MAX_RETRIES", "5"))
+    STATE_PROBE_INTERVAL: float = float(os.getenv("STATE_PROBE_INTERVAL", "15"))
     
     # Model Configuration
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "intfloat/multilingual-e5-large")
+    # Optional shared embedding server ("unix:/path.sock" or "tcp://host:port");
+    # when set, API workers use it instead of loading their own model copy
+    EMBEDDING_SERVER_ADDRESS: str = os.getenv("EMBEDDING_SERVER_ADDRESS", "")
+    EMBEDDING_SERVER_MAX_BATCH: int = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH", "64"))
+    EMBEDDING_SERVER_BATCH_WAIT_MS: float = float(os.getenv("EMBEDDING_SERVER_BATCH_WAIT_MS", "5"))
     LLM_MODEL: str = os.getenv("LLM_MODEL", "gpt-4o-mini")
+    LLM_MAX_TOKENS: int = int(os.getenv("LLM_MAX_TOKENS", "500"))
+    LLM_CONTEXT_TOKEN_BUDGET: int = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "1500"))
+    # LLM resilience: per-request deadline, hedging and circuit breaker
+    LLM_DEADLINE_SECONDS: float = float(os.getenv("LLM_DEADLINE_SECONDS", "20"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "1"))
+    LLM_HEDGING_ENABLED: bool = os.getenv("LLM_HEDGING_ENABLED", "false").lower() in ("1", "true", "yes")
+    LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    LLM_HEDGE_MIN_DELAY: float = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    LLM_CIRCUIT_RESET_SECONDS: float = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+    
+    # Admission control: concurrency limits and bounded wait queues per stage
+    EMBEDDING_MAX_CONCURRENCY: int = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "2"))
+    EMBEDDING_MAX_QUEUE: int = int(os.getenv("EMBEDDING_MAX_QUEUE", "32"))
+    QDRANT_MAX_CONCURRENCY: int = int(os.getenv("QDRANT_MAX_CONCURRENCY", "8"))
+    QDRANT_MAX_QUEUE: int = int(os.getenv("QDRANT_MAX_QUEUE", "64"))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    LLM_MAX_QUEUE: int = int(os.getenv("LLM_MAX_QUEUE", "32"))
+    ADMISSION_QUEUE_TIMEOUT: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+    # Serve retrieval-only answers instead of rejecting when the LLM stage is saturated
+    LLM_DEGRADED_MODE: bool = os.getenv("LLM_DEGRADED_MODE", "false").lower() in ("1", "true", "yes")
+    
+    # Response compression
+    GZIP_ENABLED: bool = os.getenv("GZIP_ENABLED", "false").lower() in ("1", "true", "yes")
+    GZIP_MIN_SIZE: int = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+    
+    # Listing answers served from the org hierarchy index
+    ORG_LIST_PAGE_SIZE: int = int(os.getenv("ORG_LIST_PAGE_SIZE", "20"))
     
     # Data Configuration
     DATA_PATH: str = os.getenv("DATA_PATH", "../data/ad users.xlsx")
+    UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "../data/uploads")
+    SOURCE_CACHE_DIR: str = os.getenv("SOURCE_CACHE_DIR", "../data/.cache")
+    CSV_CHUNK_SIZE: int = int(os.getenv("CSV_CHUNK_SIZE", "50000"))
+    
+    # Collection snapshots for fast bootstrap (Qdrant server only)
+    SNAPSHOT_DIR: str = os.getenv("SNAPSHOT_DIR", "../data/snapshots")
+    SNAPSHOT_ON_INGEST: bool = os.getenv("SNAPSHOT_ON_INGEST", "true").lower() in ("1", "true", "yes")
+    SNAPSHOT_RESTORE_ON_STARTUP: bool = os.getenv("SNAPSHOT_RESTORE_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+    SNAPSHOT_KEEP: int = int(os.getenv("SNAPSHOT_KEEP", "3"))
     
     @property
     def qdrant_url(self) -> str:
@@ -1,7 +1,7 @@
 """FastAPI main application entry point."""
 import sys
 from pathlib import Path
-from typing import List  # Needed for type hints in caching helpers
+from typing import List, Dict, Any, Optional  # Needed for type hints in helpers
 
 # Add parent directory to path so 'app' module can be found when running directly
 # This allows running: python main.py from the backend/app/ directory
@@ -10,21 +10,37 @@ backend_dir = current_file.parent.parent
 if str(backend_dir) not in sys.path:
     sys.path.insert(0, str(backend_dir))
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import os
 import asyncio
+import csv
+import io
+import json
+import uuid
 from contextlib import asynccontextmanager
 
-from app.models import QueryRequest, QueryResponse, HealthResponse, SearchResult
-from app.services.ingestion import process_data_file, generate_embeddings, get_embedding_model
+from app.models import QueryRequest, QueryResponse, HealthResponse
+from app.services.ingestion import (
+    process_data_file, generate_embeddings, get_embedding_model, get_document_id, METADATA_FIELDS
+)
 from app.services.vector_store import VectorStore
 from app.services.llm_engine import LLMEngine
-from app.services.query_processor import preprocess_query
+from app.services.query_processor import preprocess_query, normalize_query, detect_listing_intent, mentions_role
+from app.services.state_monitor import StateMonitor
+from app.services.org_index import OrgIndex, normalize_unit_name
+from app.services.jobs import JobQueue, IngestionJob
+from app.services.snapshots import SnapshotManager
+from app.services.bulk_upload import IngestionCheckpoint
+from app.services.coalescing import SingleFlight
+from app.services.admission import AdmissionController, StageOverloaded
+from app.services.context_builder import build_retrieval_only_answer, CONTEXT_FIELDS
 from app.config import settings
 import hashlib
+import numpy as np
 from functools import lru_cache
 
 # Initialize services
@@ -34,6 +50,197 @@ llm_engine = None  # Will be initialized on first use
 # Global flag to track ingestion status
 ingestion_in_progress = False
 ingestion_completed = False
+ingestion_lock = asyncio.Lock()  # Serializes startup ingestion, /reindex and upload jobs
+
+def _rebuild_org_index(metadatas: List[Dict[str, Any]]):
+    """Rebuild the org hierarchy index from freshly ingested metadata."""
+    org_index.rebuild((get_document_id(metadata), metadata) for metadata in metadatas)
+
+async def _load_org_index_from_store():
+    """Rebuild the org hierarchy index from the payloads already stored in Qdrant."""
+    loop = asyncio.get_running_loop()
+    metadatas = []
+    offset = None
+    try:
+        while True:
+            records, offset = await loop.run_in_executor(
+                None,
+                lambda: vector_store.scroll_page(limit=1000, offset=offset, payload_fields=METADATA_FIELDS)
+            )
+            metadatas.extend(records)
+            if offset is None:
+                break
+    except Exception as e:
+        print(f"Warning: could not load org index from Qdrant: {e}")
+        return
+    await loop.run_in_executor(
+        None, lambda: _rebuild_org_index([{f: r.get(f, "") for f in METADATA_FIELDS} for r in metadatas])
+    )
+
+def _resolve_data_path() -> Optional[str]:
+    """Locate the default data file (project data/ directory, then DATA_PATH)."""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(os.path.dirname(current_dir))
+    candidates = [
+        os.path.join(project_root, "data", "ad users.xlsx"),
+        settings.DATA_PATH,
+    ]
+    for data_path in candidates:
+        if os.path.exists(data_path):
+            return os.path.abspath(data_path)
+    return None
+
+async def _ingest_file(
+    data_path: str,
+    job: Optional[IngestionJob] = None,
+    company: Optional[str] = None
+) -> int:
+    """
+    Parse, embed and load a data file, replacing the current collection.
+    
+    The old collection is only dropped after embedding has finished, so the
+    service keeps answering from the previous data for most of the run.
+    With ``company``, only that Company's rows are re-ingested and only its
+    partition is replaced; the rest of the directory stays untouched.
+    Callers must hold ``ingestion_lock``.
+    
+    Args:
+        data_path: Path of the Excel/CSV file
+        job: Optional job that receives stage and progress updates
+        company: Only re-ingest this Company (faculty)
+        
+    Returns:
+        Number of ingested documents
+    """
+    loop = asyncio.get_running_loop()
+    
+    def set_stage(stage: str, rows_total: Optional[int] = None):
+        if job is not None:
+            job.set_stage(stage, rows_total)
+    
+    progress = job.update_progress if job is not None else None
+    
+    set_stage("parsing")
+    # Uploaded files are one-off, so only cache the parsed default data file
+    documents, metadatas = await loop.run_in_executor(
+        None, lambda: process_data_file(data_path, use_cache=job is None)
+    )
+    if company is not None:
+        wanted = normalize_unit_name(company)
+        rows = await loop.run_in_executor(None, lambda: [
+            (doc, metadata) for doc, metadata in zip(documents, metadatas)
+            if normalize_unit_name(metadata.get("Company") or "") == wanted
+        ])
+        if not rows:
+            raise ValueError(f"No rows found for company: {company}")
+        documents = [doc for doc, _ in rows]
+        metadatas = [metadata for _, metadata in rows]
+        # Stored spellings of the faculty plus the ones in the new rows, so the
+        # delete below matches exactly what is in the store
+        company_values = sorted(
+            {metadata.get("Company") or "" for metadata in metadatas}
+            | set(org_index.stored_values(company, "company"))
+        )
+    
+    # Embeddings and acknowledged upload ranges survive a failed run, so
+    # re-running the same input resumes instead of starting over
+    # (hashing every document runs in the thread pool, like all blocking
+    # steps below, so the API keeps serving during background jobs)
+    checkpoint = await loop.run_in_executor(
+        None, lambda: IngestionCheckpoint(settings.SOURCE_CACHE_DIR, documents, scope=company or "")
+    )
+    set_stage("embedding", len(documents))
+    embeddings = await loop.run_in_executor(None, checkpoint.load_embeddings)
+    if embeddings is not None and len(embeddings) == len(documents):
+        print(f"Reusing {len(embeddings)} embeddings from an interrupted ingestion")
+    else:
+        # Generate embeddings (CPU-intensive, run in thread pool)
+        print("Generating embeddings... (this may take several minutes)")
+        embeddings = await loop.run_in_executor(
+            None, lambda: generate_embeddings(documents, progress=progress)
+        )
+        checkpoint.restart()
+        await loop.run_in_executor(None, lambda: checkpoint.save_embeddings(embeddings))
+    
+    set_stage("uploading", len(documents))
+    existing = await loop.run_in_executor(None, vector_store.existing_collections)
+    if checkpoint.resuming and set(checkpoint.collections) <= set(existing):
+        print("Resuming interrupted upload; keeping already stored documents")
+    else:
+        checkpoint.restart()
+        if company is not None:
+            await loop.run_in_executor(None, vector_store.delete_partition, company_values)
+        else:
+            if existing:
+                await loop.run_in_executor(None, vector_store.delete_collection)
+            state_monitor.mark_collection_missing()
+    
+    # Create collection with correct vector size
+    vector_size = embeddings.shape[1] if len(embeddings) else 1024
+    await loop.run_in_executor(None, lambda: vector_store.create_collection(vector_size=vector_size))
+    
+    print("Inserting documents into vector store...")
+    await loop.run_in_executor(
+        None,
+        lambda: vector_store.upsert_documents(
+            embeddings, documents, metadatas, progress=progress, checkpoint=checkpoint
+        )
+    )
+    await loop.run_in_executor(None, checkpoint.clear)
+    if company is not None:
+        points_count = await loop.run_in_executor(None, vector_store.count_points)
+        state_monitor.mark_collection_ready(points_count)
+        await _load_org_index_from_store()
+    else:
+        state_monitor.mark_collection_ready(len(documents))
+        await loop.run_in_executor(None, _rebuild_org_index, metadatas)
+    
+    if settings.SNAPSHOT_ON_INGEST and snapshot_manager.enabled:
+        set_stage("snapshotting")
+        try:
+            await loop.run_in_executor(None, snapshot_manager.create)
+        except Exception as e:
+            # The ingestion itself succeeded; a missing snapshot only slows the next bootstrap
+            print(f"Warning: could not create snapshot after ingestion: {e}")
+    return len(documents)
+
+async def _restore_snapshot(snapshot_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Restore the vector store from a local snapshot and reload derived state.
+    
+    Callers must hold ``ingestion_lock``.
+    
+    Args:
+        snapshot_id: Snapshot to restore (default: the newest compatible one)
+        
+    Returns:
+        Manifest of the restored snapshot
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        manifest = await loop.run_in_executor(None, lambda: snapshot_manager.restore(snapshot_id))
+    except Exception:
+        state_monitor.request_probe()
+        raise
+    points_count = await loop.run_in_executor(None, vector_store.count_points)
+    state_monitor.mark_collection_ready(points_count)
+    await _load_org_index_from_store()
+    return manifest
+
+async def _run_ingestion_job(job: IngestionJob):
+    """Job runner: ingest an uploaded file, then delete the upload."""
+    try:
+        async with ingestion_lock:
+            print(f"Starting ingestion job {job.id} with file: {job.source_path}")
+            await _ingest_file(job.source_path, job)
+    except Exception:
+        state_monitor.request_probe()
+        raise
+    finally:
+        try:
+            os.remove(job.source_path)
+        except OSError:
+            pass
 
 async def background_ingestion():
     """Background task for data ingestion."""
@@ -54,46 +261,36 @@ async def background_ingestion():
         
         # Check if collection exists, if not, create and populate it
         if not vector_store.collection_exists():
-            print("Collection does not exist. Starting background ingestion...")
-            
-            # Process data file - try multiple possible paths
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            project_root = os.path.dirname(os.path.dirname(current_dir))
-            data_path = os.path.join(project_root, "data", "ad users.xlsx")
-            
-            if not os.path.exists(data_path):
-                # Try alternative path
-                data_path = os.path.join(current_dir, "..", "..", "data", "ad users.xlsx")
-                data_path = os.path.abspath(data_path)
-            
-            if not os.path.exists(data_path):
-                data_path = settings.DATA_PATH
-                if not os.path.exists(data_path):
-                    print(f"ERROR: Data file not found at {data_path}")
-                    print("Please ensure the data file exists. The server will start, but queries will fail.")
-                    ingestion_in_progress = False
+            # A local snapshot gets a new replica ready without re-embedding
+            if settings.SNAPSHOT_RESTORE_ON_STARTUP and snapshot_manager.enabled:
+                try:
+                    async with ingestion_lock:
+                        manifest = await _restore_snapshot()
+                    print(f"✅ Restored snapshot {manifest['id']} ({manifest['points_count']} points)")
+                    ingestion_completed = True
                     return
+                except LookupError:
+                    print("No compatible snapshot found.")
+                except Exception as e:
+                    print(f"Warning: snapshot restore failed, falling back to full ingestion: {e}")
             
-            print(f"Processing data file: {data_path}")
-            documents, metadatas = process_data_file(data_path)
-            
-            # Generate embeddings (this is CPU-intensive, run in background)
-            print("Generating embeddings... (this may take several minutes)")
-            # Run CPU-intensive task in thread pool
-            loop = asyncio.get_event_loop()
-            embeddings = await loop.run_in_executor(None, generate_embeddings, documents)
+            print("Collection does not exist. Starting background ingestion...")
             
-            # Create collection with correct vector size
-            vector_size = len(embeddings[0]) if embeddings else 1024
-            vector_store.create_collection(vector_size=vector_size)
+            data_path = _resolve_data_path()
+            if data_path is None:
+                print(f"ERROR: Data file not found at {settings.DATA_PATH}")
+                print("Please ensure the data file exists. The server will start, but queries will fail.")
+                ingestion_in_progress = False
+                return
             
-            # Insert documents
-            print("Inserting documents into vector store...")
-            vector_store.upsert_documents(embeddings, documents, metadatas)
+            print(f"Processing data file: {data_path}")
+            async with ingestion_lock:
+                await _ingest_file(data_path)
             print("✅ Data ingestion completed!")
             ingestion_completed = True
         else:
             print("Collection already exists. Skipping ingestion.")
+            await _load_org_index_from_store()
             ingestion_completed = True
     except Exception as e:
         print(f"ERROR during background data ingestion: {e}")
@@ -108,11 +305,17 @@ async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events."""
     # Startup: Start background ingestion task
     print("🚀 Starting server...")
+    # Start background Qdrant state monitor; failed operations trigger a fast re-probe
+    vector_store.on_error = state_monitor.request_probe
+    state_monitor.start()
+    job_queue.start()
     print("Server is ready! Data ingestion is running in the background.")
     asyncio.create_task(background_ingestion())
     yield
     # Shutdown: cleanup if needed
     print("Shutting down...")
+    await job_queue.stop()
+    await state_monitor.stop()
 
 app = FastAPI(
     title="Óbuda University Phonebook RAG API",
@@ -130,6 +333,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Optional gzip compression of larger responses (e.g. /query with many sources)
+if settings.GZIP_ENABLED:
+    app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MIN_SIZE)
+
 # Mount static files (CSS, JS, assets) - must be before routes
 current_dir = Path(__file__).parent
 project_root = current_dir.parent.parent
@@ -139,9 +346,22 @@ if frontend_path.exists():
     # Mount static files directory for CSS, JS, and assets
     app.mount("/static", StaticFiles(directory=str(frontend_path)), name="static")
 
-# Initialize services
-vector_store = VectorStore()
-llm_engine = None  # Will be initialized on first use
+# Initialize services (vector_store and llm_engine are created above)
+state_monitor = StateMonitor(vector_store)
+query_coalescer = SingleFlight()  # Shares in-flight /query executions
+org_index = OrgIndex()  # Organizational hierarchy for listing/count queries
+job_queue = JobQueue(_run_ingestion_job)  # Background ingestion of uploaded files
+admission = AdmissionController()  # Per-stage concurrency limits and load shedding
+snapshot_manager = SnapshotManager(vector_store)  # Local collection snapshots
+
+@app.exception_handler(StageOverloaded)
+async def stage_overloaded_handler(request, exc: StageOverloaded):
+    """Shed load with a fast 429/503 response and a Retry-After hint."""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": f"Service overloaded ({exc.stage}: {exc.reason}). Please retry later."},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 def initialize_llm():
     """Lazy initialization of LLM engine."""
@@ -157,10 +377,12 @@ def initialize_llm():
 _query_embedding_cache = {}
 
 @lru_cache(maxsize=1000)
-def _get_cached_query_embedding(query_hash: str, query_text: str) -> List[float]:
+def _get_cached_query_embedding(query_hash: str, query_text: str) -> Optional[np.ndarray]:
     """
     Get cached query embedding or generate new one.
     Uses simple dict cache for better control and performance.
+    Embeddings are cached as read-only float32 arrays (4 KB each at 1024
+    dimensions, instead of ~32 KB as a list of Python floats).
     """
     if query_hash in _query_embedding_cache:
         return _query_embedding_cache[query_hash]
@@ -169,11 +391,12 @@ def _get_cached_query_embedding(query_hash: str, query_text: str) -> List[float]
     embeddings = list(model.embed([query_text]))
     embedding = embeddings[0] if embeddings else None
     
-    # Convert numpy array to list if needed
-    if embedding is not None and hasattr(embedding, 'tolist'):
-        embedding = embedding.tolist()
+    if embedding is not None:
+        # Own contiguous copy (not a view into the model's batch output), shared read-only
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
     
-    # Check if we have a valid embedding (list with elements)
+    # Check if we have a valid embedding (non-empty vector)
     if embedding is not None and len(embedding) > 0:
         # Cache up to 1000 queries (FIFO eviction)
         if len(_query_embedding_cache) >= 1000:
@@ -197,24 +420,28 @@ async def root():
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Health check endpoint."""
-    is_connected = vector_store.is_connected()
-    collection_exists = vector_store.collection_exists() if is_connected else False
-    
-    # Check collection info if it exists
-    collection_info = None
-    if is_connected and collection_exists:
-        try:
-            collection_info = vector_store.client.get_collection(vector_store.collection_name)
-        except:
-            pass
-    
+    """Health check endpoint (served from the cached Qdrant state)."""
     return HealthResponse(
-        status="healthy" if is_connected and collection_exists else "degraded",
-        qdrant_connected=is_connected,
-        collection_exists=collection_exists
+        status="healthy" if state_monitor.is_ready else "degraded",
+        qdrant_connected=state_monitor.qdrant_connected,
+        collection_exists=state_monitor.collection_exists,
+        points_count=state_monitor.points_count,
+        last_checked=state_monitor.last_checked
     )
 
+@app.get("/stats")
+async def stats():
+    """Admission-control queue depths, rejection counts and coalescing counters."""
+    return {
+        "stages": admission.stats(),
+        "llm": llm_engine.stats() if llm_engine is not None else None,
+        "coalescing": {
+            "in_flight": query_coalescer.in_flight,
+            "executions": query_coalescer.executions,
+            "coalesced": query_coalescer.coalesced,
+        },
+    }
+
 @app.get("/collection-info")
 async def collection_info():
     """Get information about the collection."""
@@ -241,6 +468,16 @@ async def collection_info():
             "points_count": points_count,
         }
         
+        if vector_store.sharded:
+            # Partitioned mode: the base name is only a prefix, report each partition
+            partitions = [
+                {"name": name, "points_count": vector_store.client.count(collection_name=name).count}
+                for name in vector_store.existing_collections()
+            ]
+            result["points_count"] = sum(p["points_count"] for p in partitions)
+            result["partitions"] = partitions
+            return result
+        
         # Try to get collection info, but catch Pydantic validation errors
         try:
             info = vector_store.client.get_collection(collection_name)
@@ -258,156 +495,580 @@ async def collection_info():
         import traceback
         return {"error": str(e), "traceback": traceback.format_exc()}
 
-@app.post("/query", response_model=QueryResponse)
-async def query(request: QueryRequest):
+def _query_response(
+    answer: str,
+    language: str,
+    sources: Optional[List[Dict[str, Any]]] = None,
+    usage: Optional[Dict[str, int]] = None,
+    degraded: bool = False
+) -> Dict[str, Any]:
+    """Build a /query response body as a plain dict (same shape as QueryResponse)."""
+    return {
+        "answer": answer,
+        "sources": sources or [],
+        "language": language,
+        "usage": usage,
+        "degraded": degraded,
+    }
+
+def _project_sources(
+    search_results: List[Dict[str, Any]],
+    fields: Optional[List[str]]
+) -> List[Dict[str, Any]]:
     """
-    Process a natural language query and return an answer.
+    Build compact source entries from raw search hits.
+    
+    Without a field list the hit payloads are passed through as-is; with one,
+    only the requested metadata fields (and "content" if requested) are kept.
+    """
+    if fields is None:
+        return [
+            {"score": hit["score"], "metadata": hit["metadata"], "content": hit["content"]}
+            for hit in search_results
+        ]
+    return [
+        {
+            "score": hit["score"],
+            "metadata": {f: hit["metadata"][f] for f in fields if f in hit["metadata"] and f != "content"},
+            "content": hit["content"] if "content" in fields else "",
+        }
+        for hit in search_results
+    ]
+
+def _answer_listing_query(request: QueryRequest) -> Optional[Dict[str, Any]]:
+    """
+    Answer "who works at X" / "how many people at X" from the org index.
+    
+    Returns:
+        Query response body, or None if the query is not a listing query
+        about a known unit (the regular pipeline handles it then)
+    """
+    intent = detect_listing_intent(request.query)
+    if intent is None or not org_index.is_ready:
+        return None
+    match = org_index.match_unit(request.query)
+    if match is None:
+        return None
+    # "Who are the deans at X" asks for specific people, not the member list;
+    # the unit names themselves may contain a role word ("Dékáni Hivatal")
+    remainder = normalize_query(request.query)
+    for name in (match["path"] or match["name"]).split("/"):
+        remainder = remainder.replace(normalize_query(name), " ")
+    if mentions_role(remainder):
+        return None
+    
+    # Name same-named units by their parent ("Dékáni Hivatal (Informatikai Kar)")
+    unit = match["name"]
+    parents = match["path"].split("/")[:-1] if match["path"] else []
+    if parents:
+        unit = f"{unit} ({parents[-1]})"
+    
+    hu = request.language == "hu"
+    if intent == "count":
+        total = org_index.count(match["name"], path=match["path"])
+        if hu:
+            answer = f"A(z) {unit} egységhez {total} munkatárs tartozik a telefonkönyv szerint."
+        else:
+            answer = f"According to the phonebook, {total} people belong to {unit}."
+        return _query_response(answer, request.language)
+    
+    page = org_index.list_members(
+        match["name"], page=1, page_size=settings.ORG_LIST_PAGE_SIZE, path=match["path"]
+    )
+    lines = []
+    for person in page["items"]:
+        details = [d for d in (person["Title"], person["TelephoneNumber"], person["UPN"]) if d]
+        lines.append(f"- {person['DisplayName']}" + (f" ({', '.join(details)})" if details else ""))
+    if hu:
+        answer = f"A(z) {unit} egységhez {page['total']} munkatárs tartozik:\n" + "\n".join(lines)
+        if page["total"] > len(lines):
+            answer += f"\n\n...és további {page['total'] - len(lines)} fő."
+    else:
+        answer = f"{page['total']} people belong to {unit}:\n" + "\n".join(lines)
+        if page["total"] > len(lines):
+            answer += f"\n\n...and {page['total'] - len(lines)} more."
+    
+    sources = []
+    if request.include_sources:
+        hits = [{"score": 1.0, "metadata": person, "content": ""} for person in page["items"]]
+        sources = _project_sources(hits, request.fields)
+    return _query_response(answer, request.language, sources)
+
+def _stored_company_values(company: str) -> List[str]:
+    """
+    Exact Company values stored for a user-supplied faculty name.
+    
+    Payload filters match Company exactly, while users give it in any case
+    or spacing; the org index knows the stored spellings. Falls back to the
+    given value if the faculty is not in the index.
+    """
+    return org_index.stored_values(company, "company") or [company]
+
+def _route_companies(request: QueryRequest) -> Optional[List[str]]:
+    """
+    Companies (faculties) a query's vector search is restricted to.
+    
+    An explicit ``company`` always applies. In partitioned mode a faculty
+    named in the query text routes the search to its partition only;
+    otherwise the search fans out to all partitions.
+    """
+    if request.company:
+        return _stored_company_values(request.company)
+    if vector_store.sharded and org_index.is_ready:
+        match = org_index.match_unit(request.query, kinds=("company",))
+        if match is not None:
+            return _stored_company_values(match["name"])
+    return None
+
+async def _run_query_pipeline(request: QueryRequest) -> Dict[str, Any]:
+    """
+    Run the full query pipeline: embedding, vector search and LLM answer.
+    
+    Blocking stages run in their admission stage's thread pool so the event
+    loop stays free to accept (and coalesce) other requests, and each stage's
+    queue depth reflects its actual saturation.
     
     Args:
         request: Query request with query text and language
         
     Returns:
-        Query response with answer and sources
+        Query response body (see QueryResponse) as a plain dict
     """
-    try:
-        # Initialize LLM if needed
-        llm = initialize_llm()
-        if llm is None:
-            raise HTTPException(
-                status_code=500,
-                detail="LLM engine not available. Please check OPENAI_API_KEY."
-            )
-        
-        # Check if collection exists and has data
-        if not vector_store.collection_exists():
-            if request.language == "hu":
-                answer = "Az adatbázis még nincs betöltve. Kérlek várj egy pillanatot, majd próbáld újra."
-            else:
-                answer = "Database is not loaded yet. Please wait a moment and try again."
-            return QueryResponse(
-                answer=answer,
-                sources=[],
-                language=request.language
-            )
-        
-        # Preprocess query for better results
-        processed_query = preprocess_query(request.query)
-        
-        # Generate query embedding with caching
-        query_text = f"query: {processed_query}"
-        query_hash = hashlib.md5(query_text.encode()).hexdigest()
-        
-        print(f"Generating embedding for query: {request.query} (processed: {processed_query})")
-        query_embedding = _get_cached_query_embedding(query_hash, query_text)
-        
-        # Convert to list if it's a numpy array
-        if hasattr(query_embedding, 'tolist'):
-            query_embedding = query_embedding.tolist()
-        
-        # Check if embedding is valid (empty list or None)
-        if query_embedding is None or (isinstance(query_embedding, list) and len(query_embedding) == 0):
-            raise HTTPException(status_code=500, detail="Failed to generate query embedding")
-        
-        print(f"Query embedding generated, vector size: {len(query_embedding)}")
-        
-        # Search in vector store with adaptive threshold
-        print(f"Searching in collection '{vector_store.collection_name}' with top_k={request.top_k}")
-        search_results = vector_store.search(
+    # Check if collection exists and has data (cached by the state monitor)
+    if not state_monitor.collection_exists:
+        state_monitor.request_probe()
+        if request.language == "hu":
+            answer = "Az adatbázis még nincs betöltve. Kérlek várj egy pillanatot, majd próbáld újra."
+        else:
+            answer = "Database is not loaded yet. Please wait a moment and try again."
+        return _query_response(answer, request.language)
+    
+    # Membership/count questions are answered directly from the org index
+    listing = _answer_listing_query(request)
+    if listing is not None:
+        return listing
+    
+    # Initialize LLM if needed (listing answers above never call it)
+    llm = initialize_llm()
+    if llm is None:
+        raise HTTPException(
+            status_code=500,
+            detail="LLM engine not available. Please check OPENAI_API_KEY."
+        )
+    
+    # Preprocess query for better results
+    processed_query = preprocess_query(request.query)
+    
+    # Generate query embedding with caching
+    query_text = f"query: {processed_query}"
+    query_hash = hashlib.md5(query_text.encode()).hexdigest()
+    
+    print(f"Generating embedding for query: {request.query} (processed: {processed_query})")
+    query_embedding = await admission.stage("embedding").run(
+        _get_cached_query_embedding, query_hash, query_text
+    )
+    
+    # Check if embedding is valid (empty vector or None)
+    if query_embedding is None or len(query_embedding) == 0:
+        raise HTTPException(status_code=500, detail="Failed to generate query embedding")
+    
+    print(f"Query embedding generated, vector size: {len(query_embedding)}")
+    
+    # Fetch only the payload fields needed by the LLM and the requested sources
+    payload_fields = None
+    if request.fields is not None or not request.include_sources:
+        payload_fields = [field for field, _ in CONTEXT_FIELDS]
+        if request.include_sources:
+            payload_fields += [f for f in request.fields if f not in payload_fields]
+    
+    # Route to the faculty's partition if one is given or named in the query
+    companies = _route_companies(request)
+    
+    # Search in vector store with adaptive threshold
+    print(f"Searching in collection '{vector_store.collection_name}' with top_k={request.top_k}"
+          + (f", companies={companies}" if companies else ""))
+    search_results = await admission.stage("qdrant").run(
+        lambda: vector_store.search(
             query_embedding=query_embedding,
             top_k=request.top_k,
-            query_text=processed_query  # Pass for adaptive threshold
+            query_text=processed_query,  # Pass for adaptive threshold
+            payload_fields=payload_fields,
+            companies=companies
         )
-        print(f"Search returned {len(search_results)} results")
+    )
+    print(f"Search returned {len(search_results)} results")
+    
+    if not search_results:
+        # No results found
+        if request.language == "hu":
+            answer = "Sajnos nem találtam találatot a telefonkönyvben a keresésre."
+        else:
+            answer = "Sorry, I couldn't find any results in the phonebook for your search."
         
-        if not search_results:
-            # No results found
-            if request.language == "hu":
-                answer = "Sajnos nem találtam találatot a telefonkönyvben a keresésre."
-            else:
-                answer = "Sorry, I couldn't find any results in the phonebook for your search."
-            
-            return QueryResponse(
-                answer=answer,
-                sources=[],
+        return _query_response(answer, request.language)
+    
+    # Generate answer using LLM (or fall back to a retrieval-only answer when saturated)
+    usage = None
+    degraded = False
+    try:
+        answer, usage = await admission.stage("llm").run(
+            lambda: llm.generate_answer_with_usage(
+                query=request.query,
+                context=search_results,
                 language=request.language
             )
-        
-        # Generate answer using LLM
-        answer = llm.generate_answer(
-            query=request.query,
-            context=search_results,
-            language=request.language
-        )
-        
-        # Format search results for response
-        formatted_results = [
-            SearchResult(
-                score=result["score"],
-                metadata=result["metadata"],
-                content=result["content"]
-            )
-            for result in search_results
-        ]
-        
-        return QueryResponse(
-            answer=answer,
-            sources=formatted_results,
-            language=request.language
         )
+    except StageOverloaded:
+        if not settings.LLM_DEGRADED_MODE:
+            raise
+        answer = build_retrieval_only_answer(search_results, request.language)
+        degraded = True
+    if usage is None:
+        # The LLM engine fell back to a retrieval-only answer (circuit open / call failed)
+        degraded = True
+    
+    sources = _project_sources(search_results, request.fields) if request.include_sources else []
+    return _query_response(answer, request.language, sources, usage, degraded)
+
+@app.post("/query", response_model=QueryResponse)
+async def query(request: QueryRequest):
+    """
+    Process a natural language query and return an answer.
+    
+    Concurrent requests with the same normalized query, language, top_k,
+    source projection and company share a single pipeline execution and all receive its
+    result. The body is serialized directly, skipping per-source model
+    validation.
+    
+    Args:
+        request: Query request with query text and language
         
+    Returns:
+        Query response with answer and sources
+    """
+    key = (
+        normalize_query(request.query),
+        request.language,
+        request.top_k,
+        request.include_sources,
+        tuple(request.fields) if request.fields is not None else None,
+        normalize_unit_name(request.company) if request.company else None,
+    )
+    try:
+        body = await query_coalescer.do(key, lambda: _run_query_pipeline(request))
+        return JSONResponse(content=body)
+    except (HTTPException, StageOverloaded):
+        raise
     except Exception as e:
+        state_monitor.request_probe()
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
-async def _reindex_internal():
-    """Internal reindexing function."""
-    # Delete existing collection
-    if vector_store.collection_exists():
-        vector_store.delete_collection()
+def _is_point_id(value: str) -> bool:
+    """Whether a string is a valid Qdrant point id (UUID or unsigned integer)."""
+    if value.isdigit():
+        return True
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
+
+async def _export_records(
+    scroll_filter,
+    cursor: Optional[str],
+    limit: Optional[int],
+    page_size: int,
+    companies: Optional[List[str]] = None
+):
+    """
+    Page through the collection with Qdrant scroll, one page in memory at a time.
     
-    # Process and ingest data - try multiple possible paths
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(os.path.dirname(current_dir))
-    data_path = os.path.join(project_root, "data", "ad users.xlsx")
+    The cursor is the id of the last record a client received; paging restarts
+    at that id and skips it, so an interrupted export can be resumed.
+    """
+    loop = asyncio.get_running_loop()
+    offset = cursor
+    sent = 0
+    while True:
+        records, next_offset = await loop.run_in_executor(
+            None,
+            lambda: vector_store.scroll_page(
+                limit=page_size,
+                offset=offset,
+                scroll_filter=scroll_filter,
+                payload_fields=METADATA_FIELDS,
+                companies=companies
+            )
+        )
+        page = [record for record in records if record["id"] != cursor]
+        if limit is not None:
+            page = page[:limit - sent]
+        sent += len(page)
+        if page:
+            yield page
+        if next_offset is None or (limit is not None and sent >= limit):
+            break
+        offset = next_offset
+
+@app.get("/directory/export")
+async def export_directory(
+    format: str = Query("ndjson", description="Output format: ndjson or csv"),
+    department: Optional[str] = Query(None, description="Only export this Department"),
+    company: Optional[str] = Query(None, description="Only export this Company (faculty)"),
+    cursor: Optional[str] = Query(None, description="Resume after the record with this id"),
+    limit: Optional[int] = Query(None, ge=1, description="Maximum number of records"),
+    page_size: int = Query(500, ge=1, le=5000, description="Records fetched from Qdrant per page")
+):
+    """
+    Stream the directory (or a filtered slice of it) as NDJSON or CSV.
     
-    if not os.path.exists(data_path):
-        # Try alternative path
-        data_path = os.path.join(current_dir, "..", "..", "data", "ad users.xlsx")
-        data_path = os.path.abspath(data_path)
+    Pages through Qdrant with scroll, so memory use is constant regardless
+    of the export size. Never embeds or calls the LLM. Each record carries
+    its point "id"; pass the last received id as ``cursor`` to resume.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    if not state_monitor.collection_exists:
+        state_monitor.request_probe()
+        raise HTTPException(status_code=503, detail="Collection does not exist")
     
-    if not os.path.exists(data_path):
-        data_path = settings.DATA_PATH
+    if cursor is not None and not _is_point_id(cursor):
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
     
-    if not os.path.exists(data_path):
-        raise HTTPException(status_code=404, detail=f"Data file not found at {data_path}")
+    companies = _stored_company_values(company) if company else None
+    scroll_filter = vector_store.build_filter(department=department, companies=companies)
+    columns = ["id"] + METADATA_FIELDS
     
-    print(f"Starting reindexing with file: {data_path}")
-    documents, metadatas = process_data_file(data_path)
+    # Fetch the first page before sending headers, so a bad cursor or an
+    # unreachable Qdrant is reported with a proper status code
+    pages = _export_records(scroll_filter, cursor, limit, page_size, companies)
+    try:
+        first_page = await pages.__anext__()
+    except StopAsyncIteration:
+        first_page = None
+    except LookupError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    except Exception as e:
+        state_monitor.request_probe()
+        raise HTTPException(status_code=503, detail=f"Error reading from Qdrant: {str(e)}")
     
-    print("Generating embeddings...")
-    # Run in thread pool to avoid blocking
-    loop = asyncio.get_event_loop()
-    embeddings = await loop.run_in_executor(None, generate_embeddings, documents)
+    async def all_pages():
+        if first_page is not None:
+            yield first_page
+            async for page in pages:
+                yield page
     
-    vector_size = len(embeddings[0]) if embeddings else 1024
-    vector_store.create_collection(vector_size=vector_size)
+    async def stream():
+        try:
+            if format == "csv":
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+                writer.writeheader()
+                yield buffer.getvalue()
+            async for page in all_pages():
+                if format == "csv":
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerows(page)
+                    yield buffer.getvalue()
+                else:
+                    yield "".join(
+                        json.dumps({c: record.get(c, "") for c in columns}, ensure_ascii=False) + "\n"
+                        for record in page
+                    )
+        except Exception as e:
+            # Headers are already sent: re-raise so the connection is aborted
+            # instead of ending the body cleanly, and clients see a truncated export
+            print(f"Error during directory export: {e}")
+            raise
     
-    print("Inserting documents...")
-    vector_store.upsert_documents(embeddings, documents, metadatas)
+    if format == "csv":
+        return StreamingResponse(
+            stream(),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="directory.csv"'}
+        )
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+def _require_org_index():
+    """Raise 503 if the org index has not been built yet."""
+    if not org_index.is_ready:
+        raise HTTPException(status_code=503, detail="Organization index is not built yet")
+
+@app.get("/directory/org")
+async def directory_org(depth: Optional[int] = Query(2, ge=0, description="Tree depth to return")):
+    """Organizational hierarchy with member counts per unit."""
+    _require_org_index()
+    return org_index.tree(depth)
+
+@app.get("/directory/units")
+async def directory_units(
+    q: str = Query("", description="Substring of the unit name"),
+    limit: int = Query(20, ge=1, le=200)
+):
+    """Find organizational units (OU, Company, Department) by name, with member counts."""
+    _require_org_index()
+    return org_index.find_units(q, limit=limit)
+
+@app.get("/directory/members")
+async def directory_members(
+    unit: Optional[str] = Query(None, description="Unit name (OU, Company or Department); same-named units are merged"),
+    path: Optional[str] = Query(None, description="OU path from /directory/org, e.g. 'Kar/Dékáni Hivatal'"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=1000)
+):
+    """Paginated member list of an organizational unit, ordered by name."""
+    if not unit and not path:
+        raise HTTPException(status_code=400, detail="Either unit or path is required")
+    _require_org_index()
+    result = org_index.list_members(unit, page=page, page_size=page_size, path=path)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Unknown unit: {path or unit}")
+    return result
+
+async def _reindex_internal(company: Optional[str] = None):
+    """Internal reindexing function (optionally limited to one Company)."""
+    data_path = _resolve_data_path()
+    if data_path is None:
+        raise HTTPException(status_code=404, detail=f"Data file not found at {settings.DATA_PATH}")
+    
+    print(f"Starting reindexing with file: {data_path}" + (f" (company: {company})" if company else ""))
+    async with ingestion_lock:
+        try:
+            documents_count = await _ingest_file(data_path, company=company)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
     
-    return {"message": "Reindexing completed successfully", "documents_count": len(documents)}
+    result = {"message": "Reindexing completed successfully", "documents_count": documents_count}
+    if company:
+        result["company"] = company
+    return result
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def _copy_upload(source, target_path: str) -> str:
+    """
+    Copy an uploaded file to disk in fixed-size chunks.
+    
+    Args:
+        source: Binary file object of the upload
+        target_path: Destination path
+        
+    Returns:
+        SHA-256 hex digest of the content
+    """
+    digest = hashlib.sha256()
+    with open(target_path, "wb") as out:
+        while True:
+            chunk = source.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+@app.post("/ingest/upload", status_code=202)
+async def upload_and_ingest(file: UploadFile = File(..., description="AD export (.xlsx or .csv)")):
+    """
+    Upload a directory export and enqueue it for ingestion.
+    
+    The file is copied to UPLOAD_DIR in fixed-size chunks. Jobs run one at a
+    time in the background; uploading a file identical to one that is still
+    queued returns the queued job. Poll ``/jobs/{id}`` for progress.
+    """
+    suffix = Path(file.filename or "").suffix.lower()
+    if suffix not in (".xlsx", ".csv"):
+        raise HTTPException(status_code=400, detail="Only .xlsx and .csv files are supported")
+    
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    target_path = os.path.join(settings.UPLOAD_DIR, f"{uuid.uuid4().hex}{suffix}")
+    loop = asyncio.get_running_loop()
+    try:
+        # Blocking file I/O runs in the executor, not on the event loop
+        sha256 = await loop.run_in_executor(None, _copy_upload, file.file, target_path)
+    except Exception:
+        # Don't leave a partial file behind in UPLOAD_DIR
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        raise
+    finally:
+        await file.close()
+    
+    job, deduplicated = job_queue.submit(target_path, file.filename, sha256)
+    if deduplicated:
+        os.remove(target_path)
+    return {"job": job.to_dict(), "deduplicated": deduplicated}
+
+@app.get("/jobs")
+async def list_jobs():
+    """List recent ingestion jobs, newest first."""
+    return [job.to_dict() for job in job_queue.list()]
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Stage, progress, throughput and errors of an ingestion job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job.to_dict()
+
+def _require_snapshots():
+    """Raise 501 if the configured Qdrant cannot take snapshots."""
+    if not snapshot_manager.enabled:
+        raise HTTPException(status_code=501, detail="Snapshots require a Qdrant server (QDRANT_LOCATION is set)")
+
+@app.get("/snapshots")
+async def list_snapshots():
+    """List local snapshots, newest first, with their compatibility."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, snapshot_manager.list)
+
+@app.post("/snapshots", status_code=201)
+async def create_snapshot():
+    """Snapshot the current collection(s) and store them locally."""
+    _require_snapshots()
+    loop = asyncio.get_running_loop()
+    async with ingestion_lock:
+        try:
+            return await loop.run_in_executor(None, snapshot_manager.create)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            state_monitor.request_probe()
+            raise HTTPException(status_code=500, detail=f"Error creating snapshot: {str(e)}")
+
+@app.post("/snapshots/restore")
+async def restore_snapshot(
+    snapshot_id: Optional[str] = Query(None, description="Snapshot to restore; newest compatible if omitted")
+):
+    """Replace the vector store contents with a local snapshot."""
+    _require_snapshots()
+    async with ingestion_lock:
+        try:
+            manifest = await _restore_snapshot(snapshot_id)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error restoring snapshot: {str(e)}")
+    return {"message": "Snapshot restored successfully", "snapshot": manifest}
 
 @app.post("/reindex")
 @app.get("/reindex")
-async def reindex():
+async def reindex(
+    company: Optional[str] = Query(None, description="Only re-ingest this Company (faculty)")
+):
     """Reindex the data (useful for updating the vector store). Supports both GET and POST."""
     try:
-        result = await _reindex_internal()
+        result = await _reindex_internal(company)
         return result
     except HTTPException:
         raise
     except Exception as e:
         import traceback
         traceback.print_exc()
+        state_monitor.request_probe()
         raise HTTPException(status_code=500, detail=f"Error during reindexing: {str(e)}")
 
 if __name__ == "__main__":
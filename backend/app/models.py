@@ -7,6 +7,15 @@ class QueryRequest(BaseModel):
     query: str = Field(..., description="The search query in natural language")
     language: str = Field(default="hu", description="Language code (hu or en)")
     top_k: int = Field(default=5, ge=1, le=20, description="Number of results to retrieve")
+    include_sources: bool = Field(default=True, description="Whether to return the source documents")
+    fields: Optional[List[str]] = Field(
+        default=None,
+        description="Metadata fields to return in sources (add 'content' for the document text); all if omitted"
+    )
+    company: Optional[str] = Field(
+        default=None,
+        description="Restrict the search to one Company (faculty); detected from the query if omitted"
+    )
 
 class SearchResult(BaseModel):
     """Model for a single search result."""
@@ -14,15 +23,25 @@ class SearchResult(BaseModel):
     metadata: Dict[str, Any]
     content: str
 
+class TokenUsage(BaseModel):
+    """LLM token usage for a single request."""
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
 class QueryResponse(BaseModel):
     """Response model for search queries."""
     answer: str = Field(..., description="The generated answer")
     sources: List[SearchResult] = Field(default_factory=list, description="Source documents used")
     language: str = Field(..., description="Language of the response")
+    usage: Optional[TokenUsage] = Field(default=None, description="LLM token usage, if the LLM was called")
+    degraded: bool = Field(default=False, description="True if the answer was built without the LLM")
 
 class HealthResponse(BaseModel):
     """Health check response."""
     status: str
     qdrant_connected: bool
     collection_exists: bool
+    points_count: Optional[int] = None
+    last_checked: Optional[float] = Field(default=None, description="Unix time of the last Qdrant probe")
 
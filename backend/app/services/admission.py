@@ -0,0 +1,156 @@
+"""Admission control: bounded concurrency and load shedding per pipeline stage."""
+import asyncio
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict
+from app.config import settings
+
+
+class StageOverloaded(Exception):
+    """Raised when a stage cannot admit a request (queue full or wait timed out)."""
+
+    def __init__(self, stage: str, status_code: int, retry_after: int, reason: str):
+        super().__init__(f"Stage '{stage}' overloaded: {reason}")
+        self.stage = stage
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class StageLimiter:
+    """
+    Limits concurrent work in one stage and bounds the number of waiters.
+
+    Up to ``max_concurrency`` requests run at once and up to ``max_queue``
+    wait for a slot. Further requests are rejected immediately with 429;
+    waiters that do not get a slot within ``queue_timeout`` seconds are
+    rejected with 503.
+
+    Each stage has its own thread pool with one thread per slot, so blocking
+    work admitted by :meth:`run` starts immediately instead of queueing
+    invisibly behind other stages in the shared default executor.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix=f"stage-{name}"
+        )
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.avg_service_time = 0.0  # Exponentially weighted, in seconds
+
+    def _retry_after(self) -> int:
+        """Estimate how long until a slot frees up, in whole seconds."""
+        backlog = (self.waiting + 1) / self.max_concurrency
+        return max(1, math.ceil(self.avg_service_time * backlog))
+
+    @property
+    def saturated(self) -> bool:
+        """Whether a new request would be rejected right now."""
+        return self._semaphore.locked() and self.waiting >= self.max_queue
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Acquire a slot in this stage for the duration of the block.
+
+        Raises:
+            StageOverloaded: If the wait queue is full or the wait timed out
+        """
+        if self.saturated:
+            self.rejected += 1
+            raise StageOverloaded(self.name, 429, self._retry_after(), "queue full")
+
+        if not self._semaphore.locked():
+            # A slot is free: take it directly (acquire returns without suspending)
+            await self._semaphore.acquire()
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise StageOverloaded(self.name, 503, self._retry_after(), "queue wait timed out")
+            finally:
+                self.waiting -= 1
+
+        self.active += 1
+        self.admitted += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.avg_service_time = (
+                elapsed if self.avg_service_time == 0.0
+                else 0.8 * self.avg_service_time + 0.2 * elapsed
+            )
+            self.active -= 1
+            self._semaphore.release()
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """
+        Run a blocking call in this stage's thread pool under a slot.
+
+        Args:
+            func: Blocking function
+            *args: Positional arguments for ``func``
+
+        Returns:
+            The function's result
+
+        Raises:
+            StageOverloaded: If the wait queue is full or the wait timed out
+        """
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+
+    def stats(self) -> Dict[str, Any]:
+        """Current queue depth and counters for monitoring."""
+        return {
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_service_time_ms": round(self.avg_service_time * 1000, 1),
+        }
+
+
+class AdmissionController:
+    """Holds one StageLimiter per pipeline stage (embedding, qdrant, llm)."""
+
+    def __init__(self):
+        timeout = settings.ADMISSION_QUEUE_TIMEOUT
+        self.stages: Dict[str, StageLimiter] = {
+            "embedding": StageLimiter(
+                "embedding", settings.EMBEDDING_MAX_CONCURRENCY, settings.EMBEDDING_MAX_QUEUE, timeout
+            ),
+            "qdrant": StageLimiter(
+                "qdrant", settings.QDRANT_MAX_CONCURRENCY, settings.QDRANT_MAX_QUEUE, timeout
+            ),
+            "llm": StageLimiter(
+                "llm", settings.LLM_MAX_CONCURRENCY, settings.LLM_MAX_QUEUE, timeout
+            ),
+        }
+
+    def stage(self, name: str) -> StageLimiter:
+        """Get the limiter for a stage."""
+        return self.stages[name]
+
+    def stats(self) -> Dict[str, Any]:
+        """Stats of all stages."""
+        return {name: limiter.stats() for name, limiter in self.stages.items()}
@@ -0,0 +1,299 @@
+"""Parallel, resumable bulk upload of embedding matrices to Qdrant."""
+import glob
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from qdrant_client.http.exceptions import UnexpectedResponse
+from qdrant_client.models import Batch
+from app.config import settings
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether an upload error is worth retrying (everything except 4xx other than 429)."""
+    if isinstance(error, UnexpectedResponse) and error.status_code is not None:
+        return error.status_code == 429 or error.status_code >= 500
+    return True
+
+
+class IngestionCheckpoint:
+    """
+    On-disk state of one ingestion run, so an interrupted run can resume.
+
+    Holds the embedding matrix (``ingest-<fingerprint>.npy``) and the row
+    ranges already acknowledged by Qdrant per collection
+    (``ingest-<fingerprint>.json``). The fingerprint covers the documents,
+    the embedding model and the target collection, so a checkpoint is only
+    reused for exactly the same input.
+    """
+
+    def __init__(self, directory: str, documents: List[str], scope: str = ""):
+        """
+        Open (or start) the checkpoint for a set of documents.
+
+        Args:
+            directory: Directory for checkpoint files
+            documents: Document texts being ingested
+            scope: Extra identity of the run (e.g. the Company of a partial reindex)
+        """
+        digest = hashlib.sha256()
+        for part in (settings.EMBEDDING_MODEL, settings.QDRANT_COLLECTION_NAME,
+                     str(settings.QDRANT_SHARD_BY_COMPANY), scope):
+            digest.update(part.encode("utf-8") + b"\0")
+        for doc in documents:
+            digest.update(doc.encode("utf-8") + b"\0")
+        self.fingerprint = digest.hexdigest()[:16]
+        self.directory = directory
+        self.embeddings_path = os.path.join(directory, f"ingest-{self.fingerprint}.npy")
+        self.state_path = os.path.join(directory, f"ingest-{self.fingerprint}.json")
+        self._ranges: Dict[str, List[List[int]]] = {}
+        self._lock = threading.Lock()
+
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                self._ranges = json.load(f).get("ranges", {})
+        except (OSError, ValueError):
+            self._ranges = {}
+
+    @property
+    def resuming(self) -> bool:
+        """Whether a previous run already uploaded part of the data."""
+        return any(self._ranges.values())
+
+    @property
+    def collections(self) -> List[str]:
+        """Collections with acknowledged rows."""
+        with self._lock:
+            return [name for name, ranges in self._ranges.items() if ranges]
+
+    def restart(self):
+        """Forget acknowledged ranges (e.g. the collection was lost); keeps the embeddings."""
+        with self._lock:
+            self._ranges = {}
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
+
+    def load_embeddings(self) -> Optional[np.ndarray]:
+        """Embeddings saved by a previous run (memory-mapped), or None."""
+        try:
+            return np.load(self.embeddings_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+    def save_embeddings(self, embeddings: np.ndarray):
+        """
+        Persist the embedding matrix and drop checkpoints of other inputs.
+
+        Args:
+            embeddings: Matrix of shape (documents, vector size)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        for stale in glob.glob(os.path.join(self.directory, "ingest-*")):
+            if self.fingerprint not in os.path.basename(stale):
+                os.remove(stale)
+        partial_path = self.embeddings_path + ".part"
+        with open(partial_path, "wb") as f:
+            np.save(f, embeddings)
+        os.replace(partial_path, self.embeddings_path)
+
+    def completed(self, collection_name: str) -> List[Tuple[int, int]]:
+        """Acknowledged [start, end) row ranges of a collection, sorted."""
+        with self._lock:
+            return [tuple(r) for r in self._ranges.get(collection_name, [])]
+
+    def mark_done(self, collection_name: str, start: int, end: int):
+        """
+        Record an acknowledged row range and persist the checkpoint.
+
+        Args:
+            collection_name: Collection the rows were written to
+            start: First row (inclusive)
+            end: Last row (exclusive)
+        """
+        with self._lock:
+            ranges = sorted(self._ranges.get(collection_name, []) + [[start, end]])
+            merged: List[List[int]] = []
+            for s, e in ranges:
+                if merged and s <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], e)
+                else:
+                    merged.append([s, e])
+            self._ranges[collection_name] = merged
+
+            os.makedirs(self.directory, exist_ok=True)
+            partial_path = self.state_path + ".part"
+            with open(partial_path, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": self.fingerprint, "ranges": self._ranges}, f)
+            os.replace(partial_path, self.state_path)
+
+    def clear(self):
+        """Remove the checkpoint files after a completed run."""
+        for path in (self.embeddings_path, self.state_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class BulkUploader:
+    """
+    Uploads rows of an embedding matrix to one collection in parallel.
+
+    Batches are sent by several worker threads with ``wait=False`` and a
+    final ``wait=True`` request acts as a consistency barrier, since Qdrant
+    applies the updates of a collection in order. Transient errors are
+    retried with exponential backoff. The batch size adapts to the observed
+    latency: halved when a batch is slower than the target or fails,
+    grown when it is well below.
+    """
+
+    def __init__(
+        self,
+        client,
+        collection_name: str,
+        batch_size: Optional[int] = None,
+        parallelism: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        target_latency: Optional[float] = None,
+        checkpoint: Optional[IngestionCheckpoint] = None
+    ):
+        """
+        Initialize the uploader.
+
+        Args:
+            client: QdrantClient
+            collection_name: Collection to write to
+            batch_size: Initial points per batch (default: settings.QDRANT_UPLOAD_BATCH_SIZE)
+            parallelism: Batches in flight (default: settings.QDRANT_UPLOAD_PARALLELISM)
+            max_retries: Retries per batch (default: settings.QDRANT_UPLOAD_MAX_RETRIES)
+            target_latency: Target seconds per batch (default: settings.QDRANT_UPLOAD_TARGET_LATENCY)
+            checkpoint: Optional checkpoint of completed ranges
+        """
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_size = batch_size or settings.QDRANT_UPLOAD_BATCH_SIZE
+        self.min_batch = settings.QDRANT_UPLOAD_MIN_BATCH
+        self.max_batch = max(settings.QDRANT_UPLOAD_MAX_BATCH, self.min_batch)
+        self.parallelism = max(1, parallelism or settings.QDRANT_UPLOAD_PARALLELISM)
+        self.max_retries = max_retries if max_retries is not None else settings.QDRANT_UPLOAD_MAX_RETRIES
+        self.target_latency = target_latency or settings.QDRANT_UPLOAD_TARGET_LATENCY
+        self.checkpoint = checkpoint
+        self.retries = 0
+
+    def _send(self, batch: Batch, wait_for_apply: bool) -> float:
+        """Send one batch, retrying transient errors; returns the final attempt's latency."""
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                self.client.upsert(collection_name=self.collection_name, points=batch, wait=wait_for_apply)
+                return time.perf_counter() - started
+            except Exception as e:
+                if attempt >= self.max_retries or not is_transient(e):
+                    raise
+                attempt += 1
+                self.retries += 1
+                delay = min(10.0, 0.5 * 2 ** (attempt - 1)) * (0.5 + random.random())
+                print(f"Upload batch failed ({e}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _adapt(self, rows: int, latency: float):
+        """Adjust the batch size to the latency of a completed batch."""
+        if latency > self.target_latency:
+            self.batch_size = max(self.min_batch, min(self.batch_size, rows) // 2)
+        elif latency < self.target_latency / 2 and rows >= self.batch_size:
+            self.batch_size = min(self.max_batch, int(self.batch_size * 1.5))
+
+    def _next_range(self, cursor: int, total: int) -> Tuple[int, int]:
+        """Next [start, end) range from ``cursor`` that is not yet completed."""
+        for start, end in self.checkpoint.completed(self.collection_name) if self.checkpoint else []:
+            if start <= cursor < end:
+                cursor = end
+            elif cursor < start:
+                return cursor, min(cursor + self.batch_size, start)
+        return cursor, min(cursor + self.batch_size, total)
+
+    def upload(
+        self,
+        embeddings: np.ndarray,
+        ids: List[str],
+        payload: Callable[[int], Dict[str, Any]],
+        progress: Optional[Callable[[int], None]] = None
+    ) -> int:
+        """
+        Upload all rows not yet recorded in the checkpoint.
+
+        Args:
+            embeddings: Matrix of shape (rows, vector size)
+            ids: Point id per row
+            payload: Function returning the payload of a row
+            progress: Optional callback receiving the number of rows stored so far
+
+        Returns:
+            Number of rows uploaded by this call (excluding resumed ones)
+        """
+        total = len(ids)
+        done = sum(e - s for s, e in self.checkpoint.completed(self.collection_name)) if self.checkpoint else 0
+        if done:
+            print(f"Resuming upload to '{self.collection_name}': {done}/{total} rows already stored")
+        uploaded = 0
+        last_batch: Optional[Batch] = None
+        error: Optional[Exception] = None
+
+        def make_batch(start: int, end: int) -> Batch:
+            # model_construct skips per-float validation of the matrix slice
+            return Batch.model_construct(
+                ids=ids[start:end],
+                vectors=np.asarray(embeddings[start:end], dtype=np.float32).tolist(),
+                payloads=[payload(i) for i in range(start, end)]
+            )
+
+        def send(start: int, end: int) -> Tuple[int, int, Batch, float]:
+            batch = make_batch(start, end)
+            return start, end, batch, self._send(batch, wait_for_apply=False)
+
+        cursor = 0
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="qdrant-upload") as pool:
+            while pending or (cursor < total and error is None):
+                while error is None and cursor < total and len(pending) < self.parallelism:
+                    start, end = self._next_range(cursor, total)
+                    if start >= total:
+                        cursor = total
+                        break
+                    pending.add(pool.submit(send, start, end))
+                    cursor = end
+
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    try:
+                        start, end, last_batch, latency = future.result()
+                    except Exception as e:
+                        # Stop issuing batches; let the ones in flight finish and be checkpointed
+                        error = error or e
+                        self.batch_size = max(self.min_batch, self.batch_size // 2)
+                        continue
+                    if self.checkpoint is not None:
+                        self.checkpoint.mark_done(self.collection_name, start, end)
+                    self._adapt(end - start, latency)
+                    uploaded += end - start
+                    done += end - start
+                    print(f"Inserted rows {start}-{end} ({latency * 1000:.0f} ms, next batch size {self.batch_size}) - Progress: {done}/{total} ({100 * done // total}%)")
+                    if progress is not None:
+                        progress(done)
+
+        if error is not None:
+            raise error
+
+        # Consistency barrier: updates are applied in order, so once this
+        # (idempotent) re-send is applied, every earlier batch is too
+        if last_batch is not None:
+            self._send(last_batch, wait_for_apply=True)
+        return uploaded
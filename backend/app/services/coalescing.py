@@ -0,0 +1,71 @@
+"""Single-flight coalescing of identical concurrent requests."""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    """An in-flight execution shared by one or more waiters."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Share one in-flight execution among concurrent callers with the same key.
+
+    The first caller for a key starts the work; callers arriving while it is
+    still running await the same result (or exception). A waiter that is
+    cancelled (e.g. client disconnect) only detaches itself; the shared work
+    is cancelled once no waiters remain.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def _forget(self, key: Hashable, call: _Call):
+        """Remove a finished call from the in-flight table."""
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run ``fn`` for ``key``, or join an identical execution already in flight.
+
+        Args:
+            key: Hashable identity of the request
+            fn: Zero-argument coroutine function performing the work
+
+        Returns:
+            The result of the shared execution
+
+        Raises:
+            Whatever the shared execution raised
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _, k=key, c=call: self._forget(k, c))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            # Shield so that cancelling one waiter does not cancel the shared task
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Last waiter left: stop the work and let new callers start afresh
+                self._forget(key, call)
+                call.task.cancel()
+
+    @property
+    def in_flight(self) -> int:
+        """Number of distinct executions currently running."""
+        return len(self._calls)
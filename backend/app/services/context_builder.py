@@ -0,0 +1,261 @@
+"""Token-budgeted, deduplicated prompt construction for the LLM engine."""
+import re
+from typing import List, Dict, Any, Optional, Tuple
+from app.config import settings
+
+try:
+    import tiktoken
+except ImportError:  # Optional: fall back to a character-based estimate
+    tiktoken = None
+
+# Metadata fields rendered into the context, in display order
+CONTEXT_FIELDS: List[Tuple[str, str]] = [
+    ("DisplayName", "Név"),
+    ("Title", "Beosztás"),
+    ("Department", "Tanszék"),
+    ("Company", "Kar"),
+    ("TelephoneNumber", "Telefonszám"),
+    ("UPN", "Email"),
+]
+
+# Static system prompts. They are sent first and never change between requests,
+# so provider-side prompt caching can reuse the prefix.
+SYSTEM_PROMPTS: Dict[str, str] = {
+    "hu": """Te az Óbudai Egyetem segítőkész telefonkönyv asszisztense vagy.
+A feladatod, hogy segíts a felhasználóknak megtalálni a keresett személyek elérhetőségeit.
+
+FONTOS SZABÁLYOK:
+1. Szigorúan csak a megadott kontextusból válaszolj. Ne találj ki információkat!
+2. Ha a keresett információ nincs a kontextusban, mondd el, hogy nem található.
+3. A válaszodban mindig tüntesd fel a pontos telefonszámot és email címet, ha elérhető.
+4. Legyél barátságos és segítőkész.
+5. Ha több találat van, sorold fel őket egyértelműen.""",
+    "en": """You are a helpful phonebook assistant for Óbuda University.
+Your task is to help users find contact information for the people they are looking for.
+
+IMPORTANT RULES:
+1. Answer strictly only from the provided context. Do not make up information!
+2. If the requested information is not in the context, tell the user it was not found.
+3. Always include the exact phone number and email address in your response if available.
+4. Be friendly and helpful.
+5. If there are multiple matches, list them clearly.""",
+}
+
+# User prompt templates. The variable question goes last so that requests
+# retrieving the same context share the longest possible prefix.
+USER_PROMPT_TEMPLATES: Dict[str, str] = {
+    "hu": """Elérhető információk a telefonkönyvből:
+{context}
+
+A felhasználó kérdése: {query}
+
+Kérlek, válaszolj a felhasználó kérdésére a fenti információk alapján.""",
+    "en": """Available information from the phonebook:
+{context}
+
+User's question: {query}
+
+Please answer the user's question based on the above information.""",
+}
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count (or estimate) the number of tokens in a text.
+
+    Uses tiktoken when installed, otherwise a conservative estimate of
+    one token per three characters.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Token count
+    """
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            try:
+                _encoding = tiktoken.encoding_for_model(settings.LLM_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+        return len(_encoding.encode(text))
+    return len(text) // 3 + 1
+
+
+def _normalize(value: Any) -> str:
+    """Normalize a field value for duplicate detection."""
+    return _WHITESPACE_RE.sub(" ", str(value)).strip().lower()
+
+
+def _dedup_key(metadata: Dict[str, Any]) -> Optional[str]:
+    """Identity key of a hit: email if present, otherwise name + phone."""
+    upn = _normalize(metadata.get("UPN", ""))
+    if upn:
+        return f"upn:{upn}"
+    name = _normalize(metadata.get("DisplayName", ""))
+    phone = _normalize(metadata.get("TelephoneNumber", ""))
+    if name or phone:
+        return f"name:{name}|{phone}"
+    return None
+
+
+def render_hit(metadata: Dict[str, Any]) -> str:
+    """
+    Render the non-empty context fields of a hit as "Label: value" lines.
+
+    Args:
+        metadata: Hit metadata (Qdrant payload)
+
+    Returns:
+        Rendered block (empty string if the hit has no usable fields)
+    """
+    lines = []
+    for field, label in CONTEXT_FIELDS:
+        value = metadata.get(field)
+        if value is None:
+            continue
+        value = str(value).strip()
+        if value:
+            lines.append(f"{label}: {value}")
+    return "\n".join(lines)
+
+
+class PromptContext:
+    """Result of building a prompt: chat messages plus bookkeeping."""
+
+    def __init__(
+        self,
+        messages: List[Dict[str, str]],
+        prompt_tokens: int,
+        hits_used: int,
+        hits_dropped: int
+    ):
+        self.messages = messages
+        self.prompt_tokens = prompt_tokens
+        self.hits_used = hits_used
+        self.hits_dropped = hits_dropped
+
+
+def build_prompt(
+    query: str,
+    context: List[Dict[str, Any]],
+    language: str = "hu",
+    token_budget: Optional[int] = None
+) -> PromptContext:
+    """
+    Build chat messages from search hits within a token budget.
+
+    Hits are taken in the given (score) order. Hits without any usable field
+    and near-duplicates of an earlier hit (same email, or same name and phone
+    when there is no email) are dropped. Hits are added until the context
+    token budget is exhausted; the best hit is always kept.
+
+    Args:
+        query: User's query
+        context: Search hits with "metadata" dictionaries
+        language: Language code (hu or en)
+        token_budget: Maximum tokens for the context block
+                      (default: settings.LLM_CONTEXT_TOKEN_BUDGET)
+
+    Returns:
+        PromptContext with the messages and token/hit counts
+    """
+    if language not in SYSTEM_PROMPTS:
+        language = "en"
+    if token_budget is None:
+        token_budget = settings.LLM_CONTEXT_TOKEN_BUDGET
+
+    seen_keys = set()
+    seen_blocks = set()
+    blocks = []
+    used_tokens = 0
+    dropped = 0
+
+    for doc in context:
+        metadata = doc.get("metadata") or {}
+        block = render_hit(metadata)
+        if not block:
+            dropped += 1
+            continue
+
+        key = _dedup_key(metadata)
+        normalized_block = _normalize(block)
+        if (key is not None and key in seen_keys) or normalized_block in seen_blocks:
+            dropped += 1
+            continue
+
+        numbered = f"[{len(blocks) + 1}] {block}"
+        block_tokens = count_tokens(numbered)
+        if blocks and used_tokens + block_tokens > token_budget:
+            dropped += 1
+            continue
+
+        if key is not None:
+            seen_keys.add(key)
+        seen_blocks.add(normalized_block)
+        blocks.append(numbered)
+        used_tokens += block_tokens
+
+    system_prompt = SYSTEM_PROMPTS[language]
+    user_prompt = USER_PROMPT_TEMPLATES[language].format(
+        context="\n\n".join(blocks),
+        query=query
+    )
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+    return PromptContext(
+        messages=messages,
+        prompt_tokens=count_tokens(system_prompt) + count_tokens(user_prompt),
+        hits_used=len(blocks),
+        hits_dropped=dropped
+    )
+
+
+# Headers for answers built without the LLM (degraded mode / LLM unavailable)
+RETRIEVAL_ONLY_HEADERS: Dict[str, str] = {
+    "hu": "A válaszgenerálás jelenleg nem érhető el, de ezeket a találatokat találtam a telefonkönyvben:",
+    "en": "Answer generation is currently unavailable, but these matches were found in the phonebook:",
+}
+
+
+def build_retrieval_only_answer(
+    context: List[Dict[str, Any]],
+    language: str = "hu",
+    max_hits: int = 5
+) -> str:
+    """
+    Format search hits as a plain answer without calling the LLM.
+
+    Args:
+        context: Search hits with "metadata" dictionaries
+        language: Language code (hu or en)
+        max_hits: Maximum number of hits to list
+
+    Returns:
+        Formatted answer string
+    """
+    if language not in RETRIEVAL_ONLY_HEADERS:
+        language = "en"
+
+    seen_keys = set()
+    blocks = []
+    for doc in context:
+        metadata = doc.get("metadata") or {}
+        block = render_hit(metadata)
+        key = _dedup_key(metadata)
+        if not block or (key is not None and key in seen_keys):
+            continue
+        if key is not None:
+            seen_keys.add(key)
+        blocks.append(f"{len(blocks) + 1}. " + block.replace("\n", ", "))
+        if len(blocks) >= max_hits:
+            break
+
+    return RETRIEVAL_ONLY_HEADERS[language] + "\n\n" + "\n".join(blocks)
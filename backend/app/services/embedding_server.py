@@ -0,0 +1,256 @@
+"""Shared out-of-process embedding server and its thin client.
+
+The server owns the single embedding model instance and serves embed requests
+from any number of API workers over a local Unix socket (or loopback TCP on
+platforms without Unix sockets). Concurrent requests are merged into batches.
+
+Run the server from the ``backend`` directory:
+
+    python -m app.services.embedding_server
+
+and point the API workers at it with ``EMBEDDING_SERVER_ADDRESS``.
+
+Wire format (both directions): a 4-byte big-endian header length, a JSON
+header, then (responses only) the raw float32 matrix of the shape given in
+the header.
+"""
+import asyncio
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+from typing import Iterable, Iterator, List, Tuple
+import numpy as np
+
+# Allow running as a script as well as with ``python -m``
+if __name__ == "__main__" and __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.config import settings
+
+_HEADER = struct.Struct(">I")
+
+
+def parse_address(address: str) -> Tuple[str, object]:
+    """
+    Parse an embedding server address.
+
+    Args:
+        address: "unix:/path/to.sock", "tcp://host:port" or a bare socket path
+
+    Returns:
+        Tuple of (family, target) where family is "unix" or "tcp"
+    """
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://"):].rpartition(":")
+        return "tcp", (host or "127.0.0.1", int(port))
+    if address.startswith("unix:"):
+        address = address[len("unix:"):]
+    return "unix", address
+
+
+# --- Client -----------------------------------------------------------------
+
+class EmbeddingClient:
+    """
+    Thin client for the embedding server.
+
+    Exposes the same ``embed()`` interface as ``fastembed.TextEmbedding`` so
+    it can be returned by ``get_embedding_model()`` in place of a local model.
+    Each thread keeps its own connection.
+    """
+
+    def __init__(self, address: str, batch_size: int = 256, timeout: float = 300):
+        self.address = address
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        family, target = parse_address(self.address)
+        if family == "tcp":
+            sock = socket.create_connection(target, timeout=self.timeout)
+        else:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(target)
+        return sock
+
+    def _recv_exact(self, sock: socket.socket, size: int) -> bytearray:
+        buf = bytearray(size)
+        view = memoryview(buf)
+        received = 0
+        while received < size:
+            n = sock.recv_into(view[received:], size - received)
+            if n == 0:
+                raise ConnectionError("Embedding server closed the connection")
+            received += n
+        return buf
+
+    def _request(self, texts: List[str]) -> np.ndarray:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = self._local.sock = self._connect()
+        try:
+            header = json.dumps({"texts": texts}).encode("utf-8")
+            sock.sendall(_HEADER.pack(len(header)) + header)
+            (header_len,) = _HEADER.unpack(self._recv_exact(sock, _HEADER.size))
+            response = json.loads(self._recv_exact(sock, header_len))
+            if "error" in response:
+                raise RuntimeError(f"Embedding server error: {response['error']}")
+            rows, dim = response["shape"]
+            data = self._recv_exact(sock, rows * dim * 4)
+            return np.frombuffer(data, dtype=np.float32).reshape(rows, dim)
+        except (OSError, ConnectionError):
+            # Drop the broken connection; the next call reconnects
+            self._local.sock = None
+            sock.close()
+            raise
+
+    def embed(self, documents: Iterable[str], batch_size: int = None) -> Iterator[np.ndarray]:
+        """
+        Embed documents on the server.
+
+        Args:
+            documents: Texts to embed (with "query:"/"passage:" prefixes)
+            batch_size: Texts per request (default: the client's batch size)
+
+        Yields:
+            One float32 embedding vector per document
+        """
+        batch_size = batch_size or self.batch_size
+        batch: List[str] = []
+        for doc in documents:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield from self._request(batch)
+                batch = []
+        if batch:
+            yield from self._request(batch)
+
+
+# --- Server -----------------------------------------------------------------
+
+class _PendingRequest:
+    def __init__(self, texts: List[str], future: asyncio.Future):
+        self.texts = texts
+        self.future = future
+
+
+class EmbeddingServer:
+    """Owns the embedding model and batches requests from all connections."""
+
+    def __init__(self, model, max_batch: int, batch_wait: float):
+        self.model = model
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self._queue: asyncio.Queue = asyncio.Queue()
+
+    async def _batcher(self):
+        """Merge queued requests into batches and embed them one batch at a time."""
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self._queue.get()]
+            size = len(pending[0].texts)
+            deadline = loop.time() + self.batch_wait
+            while size < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                size += len(item.texts)
+
+            texts = [text for item in pending for text in item.texts]
+            try:
+                matrix = await loop.run_in_executor(None, self._embed, texts)
+            except Exception as e:
+                for item in pending:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                continue
+
+            offset = 0
+            for item in pending:
+                rows = len(item.texts)
+                if not item.future.done():
+                    item.future.set_result(matrix[offset:offset + rows])
+                offset += rows
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = list(self.model.embed(texts, batch_size=self.max_batch))
+        return np.ascontiguousarray(np.stack(vectors), dtype=np.float32)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    (header_len,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+                except asyncio.IncompleteReadError:
+                    break
+                request = json.loads(await reader.readexactly(header_len))
+                texts = request.get("texts") or []
+
+                try:
+                    if texts:
+                        future = loop.create_future()
+                        await self._queue.put(_PendingRequest(texts, future))
+                        matrix = await future
+                    else:
+                        matrix = np.zeros((0, 0), dtype=np.float32)
+                    header = json.dumps({"shape": list(matrix.shape)}).encode("utf-8")
+                    writer.write(_HEADER.pack(len(header)) + header)
+                    writer.write(matrix.tobytes())
+                except Exception as e:
+                    header = json.dumps({"error": str(e)}).encode("utf-8")
+                    writer.write(_HEADER.pack(len(header)) + header)
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, address: str):
+        """Listen on the given address until cancelled."""
+        family, target = parse_address(address)
+        if family == "tcp":
+            server = await asyncio.start_server(self._handle, host=target[0], port=target[1])
+        else:
+            if os.path.exists(target):
+                os.unlink(target)
+            server = await asyncio.start_unix_server(self._handle, path=target)
+        batcher = asyncio.create_task(self._batcher())
+        print(f"Embedding server listening on {address}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+def main():
+    """Load the embedding model once and serve it."""
+    from fastembed import TextEmbedding
+
+    address = sys.argv[1] if len(sys.argv) > 1 else settings.EMBEDDING_SERVER_ADDRESS
+    if not address:
+        address = "unix:/tmp/obuda-embedding.sock"
+    print(f"Initializing embedding model: {settings.EMBEDDING_MODEL}")
+    model = TextEmbedding(model_name=settings.EMBEDDING_MODEL)
+    server = EmbeddingServer(
+        model,
+        max_batch=settings.EMBEDDING_SERVER_MAX_BATCH,
+        batch_wait=settings.EMBEDDING_SERVER_BATCH_WAIT_MS / 1000
+    )
+    try:
+        asyncio.run(server.serve(address))
+    except KeyboardInterrupt:
+        print("Embedding server stopped.")
+
+
+if __name__ == "__main__":
+    main()
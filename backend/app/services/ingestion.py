@@ -1,97 +1,216 @@
 """Data ingestion service for processing CSV/Excel files and generating embeddings."""
+import numpy as np
 import pandas as pd
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional, Callable, Iterator
 from pathlib import Path
 from fastembed import TextEmbedding
 from app.config import settings
 import hashlib
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # Optional: without pyarrow the source cache is disabled
+    pa = None
+
+# Source columns kept as document metadata (Qdrant payload fields)
+METADATA_FIELDS = ['DisplayName', 'Title', 'Department', 'Company', 'TelephoneNumber', 'UPN', 'OUPath']
 
 # Singleton embedding model cache
 _embedding_model = None
 
 def get_embedding_model():
-    """Get or create singleton embedding model instance."""
+    """
+    Get or create singleton embedding model instance.
+    
+    If EMBEDDING_SERVER_ADDRESS is set, returns a client for the shared
+    embedding server instead of loading the model in this process.
+    """
     global _embedding_model
     if _embedding_model is None:
-        print(f"Initializing embedding model: {settings.EMBEDDING_MODEL}")
-        _embedding_model = TextEmbedding(model_name=settings.EMBEDDING_MODEL)
+        if settings.EMBEDDING_SERVER_ADDRESS:
+            from app.services.embedding_server import EmbeddingClient
+            print(f"Using shared embedding server at {settings.EMBEDDING_SERVER_ADDRESS}")
+            _embedding_model = EmbeddingClient(settings.EMBEDDING_SERVER_ADDRESS)
+        else:
+            print(f"Initializing embedding model: {settings.EMBEDDING_MODEL}")
+            _embedding_model = TextEmbedding(model_name=settings.EMBEDDING_MODEL)
     return _embedding_model
 
-def process_data_file(file_path: str) -> Tuple[List[str], List[Dict[str, Any]]]:
+def _is_metadata_column(column: Any) -> bool:
+    """Column projection: only the columns used for documents/metadata are read."""
+    return column in METADATA_FIELDS
+
+def _source_cache_path(file_path: str) -> Path:
+    """
+    Cache file for a parsed source, keyed by absolute path, size and mtime.
+    
+    The file name starts with a hash of the path alone, so stale entries for
+    the same source can be found and removed.
+    """
+    abs_path = os.path.abspath(file_path)
+    stat = os.stat(abs_path)
+    path_key = hashlib.sha1(abs_path.encode('utf-8')).hexdigest()[:16]
+    version_key = hashlib.sha1(f"{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8')).hexdigest()[:16]
+    return Path(settings.SOURCE_CACHE_DIR) / f"{path_key}-{version_key}.arrow"
+
+def _write_source_cache(df: pd.DataFrame, cache_path: Path):
+    """Write the projected columns to an uncompressed Arrow IPC file (memory-mappable)."""
+    # Mixed-type object columns (e.g. phone numbers parsed as int for some rows)
+    # are stored as strings; str() of each value is what ingestion uses anyway
+    df = df.copy()
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].map(lambda v: str(v) if pd.notna(v) else None)
+    
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    feather.write_feather(df, str(tmp_path), compression="uncompressed")
+    os.replace(tmp_path, cache_path)
+    
+    # Remove cache entries of older versions of the same source
+    path_key = cache_path.name.split("-", 1)[0]
+    for stale in cache_path.parent.glob(f"{path_key}-*.arrow"):
+        if stale != cache_path:
+            stale.unlink(missing_ok=True)
+
+def iter_source_frames(file_path: str, use_cache: bool = True) -> Iterator[pd.DataFrame]:
+    """
+    Read the source file as one or more DataFrames with only the used columns.
+    
+    Excel files are parsed once and cached as Arrow (SOURCE_CACHE_DIR); later
+    reads of the unchanged file memory-map the cache. CSV files are read in
+    chunks of CSV_CHUNK_SIZE rows, so pandas never holds the whole parsed
+    table at once (the documents and metadata built from the rows still do).
+    CSV columns are read as strings, so a value is formatted the same way
+    whichever chunk it is in (per-chunk type inference would turn phone
+    numbers into ints in one chunk and floats in another).
+    
+    Args:
+        file_path: Path to the data file
+        use_cache: Whether to read/write the parsed-source cache
+        
+    Yields:
+        DataFrames with (a subset of) the METADATA_FIELDS columns
+    """
+    suffix = Path(file_path).suffix.lower()
+    
+    if suffix == '.csv':
+        yield from pd.read_csv(
+            file_path,
+            usecols=_is_metadata_column,
+            dtype=str,
+            chunksize=settings.CSV_CHUNK_SIZE
+        )
+        return
+    if suffix != '.xlsx':
+        raise ValueError(f"Unsupported file format: {Path(file_path).suffix}")
+    
+    cache_path = _source_cache_path(file_path) if use_cache and pa is not None else None
+    if cache_path is not None and cache_path.exists():
+        try:
+            table = feather.read_table(str(cache_path), memory_map=True)
+            columns = [c for c in METADATA_FIELDS if c in table.column_names]
+            print(f"Loaded parsed source from cache: {cache_path}")
+            yield table.select(columns).to_pandas()
+            return
+        except Exception as e:
+            print(f"Warning: ignoring unreadable source cache {cache_path}: {e}")
+    
+    df = pd.read_excel(file_path, usecols=_is_metadata_column)
+    if cache_path is not None:
+        try:
+            _write_source_cache(df, cache_path)
+        except Exception as e:
+            print(f"Warning: could not write source cache: {e}")
+    yield df
+
+def process_data_file(file_path: str, use_cache: bool = True) -> Tuple[List[str], List[Dict[str, Any]]]:
     """
     Process the data file (Excel/CSV) and create semantic documents.
     
     Args:
         file_path: Path to the data file
+        use_cache: Whether to use the parsed-source cache for Excel files
         
     Returns:
         Tuple of (documents, metadatas) where:
         - documents: List of semantic text representations
         - metadatas: List of metadata dictionaries
     """
-    file_path_obj = Path(file_path)
-    
-    # Read the file based on extension
-    if file_path_obj.suffix.lower() == '.xlsx':
-        df = pd.read_excel(file_path)
-    elif file_path_obj.suffix.lower() == '.csv':
-        df = pd.read_csv(file_path)
-    else:
-        raise ValueError(f"Unsupported file format: {file_path_obj.suffix}")
-    
     documents = []
     metadatas = []
     
-    for _, row in df.iterrows():
-        # Create semantic document text
-        parts = []
+    for df in iter_source_frames(file_path, use_cache=use_cache):
+        for _, row in df.iterrows():
+            # Create semantic document text
+            parts = []
         
-        if pd.notna(row.get('DisplayName')):
-            parts.append(f"Név: {row['DisplayName']}")
-        if pd.notna(row.get('Title')):
-            parts.append(f"Beosztás: {row['Title']}")
-        if pd.notna(row.get('Department')):
-            parts.append(f"Tanszék: {row['Department']}")
-        if pd.notna(row.get('Company')):
-            parts.append(f"Kar: {row['Company']}")
-        if pd.notna(row.get('TelephoneNumber')):
-            parts.append(f"Telefonszám: {row['TelephoneNumber']}")
-        if pd.notna(row.get('UPN')):
-            parts.append(f"Email: {row['UPN']}")
-        if pd.notna(row.get('OUPath')):
-            parts.append(f"Szervezeti egység: {row['OUPath']}")
+            if pd.notna(row.get('DisplayName')):
+                parts.append(f"Név: {row['DisplayName']}")
+            if pd.notna(row.get('Title')):
+                parts.append(f"Beosztás: {row['Title']}")
+            if pd.notna(row.get('Department')):
+                parts.append(f"Tanszék: {row['Department']}")
+            if pd.notna(row.get('Company')):
+                parts.append(f"Kar: {row['Company']}")
+            if pd.notna(row.get('TelephoneNumber')):
+                parts.append(f"Telefonszám: {row['TelephoneNumber']}")
+            if pd.notna(row.get('UPN')):
+                parts.append(f"Email: {row['UPN']}")
+            if pd.notna(row.get('OUPath')):
+                parts.append(f"Szervezeti egység: {row['OUPath']}")
         
-        # Create semantic document with "passage:" prefix for E5 model
-        content = ", ".join(parts)
-        document = f"passage: {content}"
-        documents.append(document)
+            # Create semantic document with "passage:" prefix for E5 model
+            content = ", ".join(parts)
+            document = f"passage: {content}"
+            documents.append(document)
         
-        # Store metadata (clean NaN values)
-        metadata = {
-            'DisplayName': str(row.get('DisplayName', '')) if pd.notna(row.get('DisplayName')) else '',
-            'Title': str(row.get('Title', '')) if pd.notna(row.get('Title')) else '',
-            'Department': str(row.get('Department', '')) if pd.notna(row.get('Department')) else '',
-            'Company': str(row.get('Company', '')) if pd.notna(row.get('Company')) else '',
-            'TelephoneNumber': str(row.get('TelephoneNumber', '')) if pd.notna(row.get('TelephoneNumber')) else '',
-            'UPN': str(row.get('UPN', '')) if pd.notna(row.get('UPN')) else '',
-            'OUPath': str(row.get('OUPath', '')) if pd.notna(row.get('OUPath')) else '',
-        }
-        metadatas.append(metadata)
+            # Store metadata (clean NaN values)
+            metadata = {
+                'DisplayName': str(row.get('DisplayName', '')) if pd.notna(row.get('DisplayName')) else '',
+                'Title': str(row.get('Title', '')) if pd.notna(row.get('Title')) else '',
+                'Department': str(row.get('Department', '')) if pd.notna(row.get('Department')) else '',
+                'Company': str(row.get('Company', '')) if pd.notna(row.get('Company')) else '',
+                'TelephoneNumber': str(row.get('TelephoneNumber', '')) if pd.notna(row.get('TelephoneNumber')) else '',
+                'UPN': str(row.get('UPN', '')) if pd.notna(row.get('UPN')) else '',
+                'OUPath': str(row.get('OUPath', '')) if pd.notna(row.get('OUPath')) else '',
+            }
+            metadatas.append(metadata)
     
     return documents, metadatas
 
-def generate_embeddings(documents: List[str]) -> List[List[float]]:
+def generate_embeddings(
+    documents: List[str],
+    progress: Optional[Callable[[int], None]] = None
+) -> np.ndarray:
     """
     Generate embeddings for documents using FastEmbed (with cached model).
     
+    Vectors are copied into one preallocated contiguous float32 matrix as
+    they are produced, instead of being kept as a list of per-row arrays.
+    
     Args:
         documents: List of document texts (already prefixed with "passage:")
+        progress: Optional callback receiving the number of documents embedded so far
         
     Returns:
-        List of embedding vectors
+        Matrix of shape (len(documents), vector size)
     """
     model = get_embedding_model()
-    embeddings = list(model.embed(documents))
+    embeddings = None
+    count = 0
+    for count, embedding in enumerate(model.embed(documents), start=1):
+        if embeddings is None:
+            embeddings = np.empty((len(documents), len(embedding)), dtype=np.float32)
+        embeddings[count - 1] = embedding
+        if progress is not None and count % 100 == 0:
+            progress(count)
+    if progress is not None:
+        progress(count)
+    if embeddings is None:
+        return np.empty((0, 0), dtype=np.float32)
     return embeddings
 
 def get_document_id(metadata: Dict[str, Any]) -> str:
@@ -0,0 +1,170 @@
+"""Background ingestion job queue with progress reporting."""
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class IngestionJob:
+    """State and progress of a single ingestion job."""
+
+    def __init__(self, source_path: str, filename: str, fingerprint: str):
+        self.id = uuid.uuid4().hex
+        self.source_path = source_path
+        self.filename = filename
+        self.fingerprint = fingerprint  # Content hash, used to deduplicate queued jobs
+        self.status = "queued"          # queued | running | completed | failed
+        self.stage = "queued"           # queued | parsing | embedding | uploading | snapshotting | done
+        self.rows_total: Optional[int] = None
+        self.rows_processed = 0
+        self.errors: List[str] = []
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._stage_started_at: Optional[float] = None
+        self._rows_finished_at: Optional[float] = None  # End of the last row stage
+
+    def set_stage(self, stage: str, rows_total: Optional[int] = None):
+        """
+        Enter a new stage.
+
+        Row stages (embedding, uploading) restart the progress counters.
+        A later stage without rows (snapshotting) keeps the counters and
+        throughput of the last row stage, so they stay visible after the
+        job completes.
+        """
+        self.stage = stage
+        if rows_total is None and self.rows_total is not None:
+            self._rows_finished_at = self._rows_finished_at or time.time()
+            return
+        self.rows_total = rows_total
+        self.rows_processed = 0
+        self._stage_started_at = time.time()
+        self._rows_finished_at = None
+
+    def update_progress(self, rows_processed: int):
+        """Record progress within the current stage (safe to call from worker threads)."""
+        self.rows_processed = rows_processed
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        """Throughput of the current (or last) row stage."""
+        if self._stage_started_at is None or not self.rows_processed:
+            return None
+        elapsed = (self._rows_finished_at or self.finished_at or time.time()) - self._stage_started_at
+        return round(self.rows_processed / elapsed, 1) if elapsed > 0 else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the job for the API."""
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "stage": self.stage,
+            "rows_total": self.rows_total,
+            "rows_processed": self.rows_processed,
+            "rows_per_second": self.rows_per_second,
+            "errors": self.errors,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    Runs ingestion jobs one at a time in a background worker.
+
+    Submitting a file whose content is identical to a job that is still
+    queued returns the queued job instead of adding a duplicate.
+    """
+
+    def __init__(self, runner: Callable[[IngestionJob], Awaitable[Any]], max_history: int = 100):
+        """
+        Initialize the queue.
+
+        Args:
+            runner: Coroutine function that performs the ingestion for a job
+            max_history: Number of jobs kept for status queries
+        """
+        self.runner = runner
+        self.max_history = max_history
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the background worker on the running event loop."""
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background worker."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    def submit(self, source_path: str, filename: str, fingerprint: str) -> Tuple[IngestionJob, bool]:
+        """
+        Enqueue an ingestion job.
+
+        Args:
+            source_path: Path of the uploaded file on disk
+            filename: Original file name
+            fingerprint: Content hash of the file
+
+        Returns:
+            Tuple of (job, deduplicated) where deduplicated is True if an
+            identical queued job was returned instead of a new one
+        """
+        for job in self._jobs.values():
+            if job.status == "queued" and job.fingerprint == fingerprint:
+                return job, True
+
+        job = IngestionJob(source_path, filename, fingerprint)
+        self._jobs[job.id] = job
+        self._trim_history()
+        self._queue.put_nowait(job)
+        return job, False
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        """Look up a job by id."""
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[IngestionJob]:
+        """All known jobs, newest first."""
+        return list(reversed(self._jobs.values()))
+
+    def _trim_history(self):
+        """Forget the oldest finished jobs beyond max_history."""
+        excess = len(self._jobs) - self.max_history
+        for job_id in [j.id for j in self._jobs.values() if j.status in ("completed", "failed")][:max(excess, 0)]:
+            del self._jobs[job_id]
+
+    async def _run(self):
+        """Worker loop: process queued jobs one at a time."""
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                await self.runner(job)
+                job.status = "completed"
+                job.stage = "done"
+            except asyncio.CancelledError:
+                job.status = "failed"
+                job.errors.append("Cancelled")
+                raise
+            except Exception as e:
+                job.status = "failed"
+                job.errors.append(str(e))
+                print(f"ERROR in ingestion job {job.id}: {e}")
+            finally:
+                job.finished_at = time.time()
@@ -1,7 +1,14 @@
 """LLM engine service for OpenAI integration."""
-from typing import List, Dict, Any
-from openai import OpenAI
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Tuple, Optional
+from openai import OpenAI, APIConnectionError, RateLimitError, InternalServerError
 from app.config import settings
+from app.services.context_builder import build_prompt, count_tokens, build_retrieval_only_answer
+from app.services.resilience import CircuitBreaker, LatencyTracker
+
+class LLMDeadlineExceeded(Exception):
+    """Raised when no LLM response arrived within the request deadline."""
 
 class LLMEngine:
     """Service for LLM operations using OpenAI."""
@@ -16,8 +23,117 @@ class LLMEngine:
         if settings.OPENAI_BASE_URL:
             client_kwargs["base_url"] = settings.OPENAI_BASE_URL
         
+        # The SDK's own retries would outlive the request deadline; _complete
+        # retries itself and gives every attempt only the remaining time
+        client_kwargs["timeout"] = settings.LLM_DEADLINE_SECONDS
+        client_kwargs["max_retries"] = 0
+        
         self.client = OpenAI(**client_kwargs)
         self.model = settings.LLM_MODEL
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.LLM_CIRCUIT_RESET_SECONDS
+        )
+        self.hedged_requests = 0
+        self.fallbacks = 0
+        # Threads for the primary and hedged calls; losers finish in the background
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(2, 2 * settings.LLM_MAX_CONCURRENCY),
+            thread_name_prefix="llm"
+        )
+    
+    def _complete(self, messages: List[Dict[str, str]], deadline: float):
+        """
+        Chat completion call with retries, all within ``deadline``.
+        
+        Each attempt gets only the time left until the deadline as its
+        timeout, and transient errors (connection errors, timeouts, 429, 5xx)
+        are retried up to LLM_MAX_RETRIES times while time remains, so no
+        attempt keeps an executor thread busy past the request deadline.
+        Records the latency of the successful attempt.
+        
+        Args:
+            messages: Chat messages
+            deadline: time.monotonic() value by which the call must finish
+        """
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMDeadlineExceeded("LLM deadline passed before the call could be sent")
+            started = time.perf_counter()
+            try:
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=settings.LLM_MAX_TOKENS,
+                    timeout=remaining
+                )
+            except (APIConnectionError, RateLimitError, InternalServerError) as e:
+                # APITimeoutError is an APIConnectionError
+                if attempt >= settings.LLM_MAX_RETRIES:
+                    raise
+                attempt += 1
+                backoff = min(0.5 * 2 ** (attempt - 1), deadline - time.monotonic())
+                print(f"LLM call failed ({e}); retry {attempt}/{settings.LLM_MAX_RETRIES}")
+                if backoff > 0:
+                    time.sleep(backoff)
+                continue
+            self.latency.record(time.perf_counter() - started)
+            return response
+    
+    def _hedge_delay(self) -> Optional[float]:
+        """Delay before firing a hedged request (p95 latency), or None if hedging is off."""
+        if not settings.LLM_HEDGING_ENABLED or len(self.latency) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        p95 = self.latency.percentile(95)
+        return max(p95, settings.LLM_HEDGE_MIN_DELAY) if p95 is not None else None
+    
+    def _complete_with_deadline(self, messages: List[Dict[str, str]]):
+        """
+        Call the LLM within the request deadline, optionally hedged.
+        
+        The primary request is sent immediately. If hedging is enabled and it
+        has not finished after the p95 latency, a second identical request is
+        sent and whichever succeeds first wins.
+        
+        Raises:
+            LLMDeadlineExceeded: If no request succeeded before the deadline
+            Exception: The last upstream error if all requests failed
+        """
+        deadline = time.monotonic() + settings.LLM_DEADLINE_SECONDS
+        pending = {self._executor.submit(self._complete, messages, deadline)}
+        hedge_delay = self._hedge_delay()
+        hedged = False
+        last_error = None
+        
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait_for = remaining
+            if hedge_delay is not None and not hedged:
+                wait_for = min(remaining, hedge_delay)
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+            
+            if hedge_delay is not None and not hedged and (not done or not pending):
+                # Primary is slow (or failed fast): fire the hedge with the remaining budget
+                hedged = True
+                self.hedged_requests += 1
+                if deadline > time.monotonic():
+                    pending.add(self._executor.submit(self._complete, messages, deadline))
+        
+        if last_error is not None and not pending:
+            raise last_error
+        raise LLMDeadlineExceeded(f"No LLM response within {settings.LLM_DEADLINE_SECONDS}s")
     
     def generate_answer(
         self,
@@ -36,76 +152,74 @@ class LLMEngine:
         Returns:
             Generated answer string
         """
-        # Build context string from retrieved documents
-        context_parts = []
-        for i, doc in enumerate(context, 1):
-            metadata = doc.get("metadata", {})
-            content = doc.get("content", "")
-            
-            context_part = f"[{i}] "
-            if metadata.get("DisplayName"):
-                context_part += f"Név: {metadata['DisplayName']}\n"
-            if metadata.get("Title"):
-                context_part += f"Beosztás: {metadata['Title']}\n"
-            if metadata.get("Department"):
-                context_part += f"Tanszék: {metadata['Department']}\n"
-            if metadata.get("Company"):
-                context_part += f"Kar: {metadata['Company']}\n"
-            if metadata.get("TelephoneNumber"):
-                context_part += f"Telefonszám: {metadata['TelephoneNumber']}\n"
-            if metadata.get("UPN"):
-                context_part += f"Email: {metadata['UPN']}\n"
-            
-            context_parts.append(context_part)
-        
-        context_text = "\n\n".join(context_parts)
+        answer, _ = self.generate_answer_with_usage(query, context, language)
+        return answer
+    
+    def generate_answer_with_usage(
+        self,
+        query: str,
+        context: List[Dict[str, Any]],
+        language: str = "hu"
+    ) -> Tuple[str, Dict[str, int]]:
+        """
+        Generate an answer and report token usage for the request.
         
-        # Build system prompt based on language
-        if language == "hu":
-            system_prompt = """Te az Óbudai Egyetem segítőkész telefonkönyv asszisztense vagy. 
-A feladatod, hogy segíts a felhasználóknak megtalálni a keresett személyek elérhetőségeit.
-
-FONTOS SZABÁLYOK:
-1. Szigorúan csak a megadott kontextusból válaszolj. Ne találj ki információkat!
-2. Ha a keresett információ nincs a kontextusban, mondd el, hogy nem található.
-3. A válaszodban mindig tüntesd fel a pontos telefonszámot és email címet, ha elérhető.
-4. Legyél barátságos és segítőkész.
-5. Ha több találat van, sorold fel őket egyértelműen."""
-            
-            user_prompt = f"""A felhasználó kérdése: {query}
-
-Elérhető információk a telefonkönyvből:
-{context_text}
-
-Kérlek, válaszolj a felhasználó kérdésére a fenti információk alapján."""
-        else:  # English
-            system_prompt = """You are a helpful phonebook assistant for Óbuda University.
-Your task is to help users find contact information for the people they are looking for.
-
-IMPORTANT RULES:
-1. Answer strictly only from the provided context. Do not make up information!
-2. If the requested information is not in the context, tell the user it was not found.
-3. Always include the exact phone number and email address in your response if available.
-4. Be friendly and helpful.
-5. If there are multiple matches, list them clearly."""
+        Args:
+            query: User's query
+            context: List of retrieved documents with metadata
+            language: Language code (hu or en)
             
-            user_prompt = f"""User's question: {query}
-
-Available information from the phonebook:
-{context_text}
-
-Please answer the user's question based on the above information."""
+        Returns:
+            Tuple of (answer, usage) where usage has prompt_tokens,
+            completion_tokens and total_tokens. If the circuit breaker is open
+            or the call fails or misses its deadline, the answer is a
+            retrieval-only listing of the hits and usage is None.
+        """
+        if not self.breaker.allow_request():
+            self.fallbacks += 1
+            return build_retrieval_only_answer(context, language), None
+        
+        prompt = build_prompt(query, context, language)
         
         # Call OpenAI API
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3,
-            max_tokens=500
+        try:
+            response = self._complete_with_deadline(prompt.messages)
+        except Exception as e:
+            print(f"LLM call failed, serving retrieval-only answer: {e}")
+            self.breaker.record_failure()
+            self.fallbacks += 1
+            return build_retrieval_only_answer(context, language), None
+        self.breaker.record_success()
+        
+        answer = response.choices[0].message.content.strip()
+        
+        # Prefer provider-reported usage, fall back to local estimates
+        if response.usage is not None:
+            prompt_tokens = response.usage.prompt_tokens
+            completion_tokens = response.usage.completion_tokens
+        else:
+            prompt_tokens = prompt.prompt_tokens
+            completion_tokens = count_tokens(answer)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        print(
+            f"LLM usage: {prompt_tokens} prompt + {completion_tokens} completion tokens "
+            f"({prompt.hits_used} hits in context, {prompt.hits_dropped} dropped)"
         )
         
-        return response.choices[0].message.content.strip()
-
+        return answer, usage
+    
+    def stats(self) -> Dict[str, Any]:
+        """Circuit state, latency percentiles and fallback counters for monitoring."""
+        p50 = self.latency.percentile(50)
+        p95 = self.latency.percentile(95)
+        return {
+            "circuit": self.breaker.state,
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedged_requests": self.hedged_requests,
+            "fallbacks": self.fallbacks,
+        }
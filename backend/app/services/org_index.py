@@ -0,0 +1,337 @@
+"""In-memory organizational hierarchy index built from OUPath/Company/Department."""
+import re
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+# Fields kept per person for listing answers
+MEMBER_FIELDS = ['DisplayName', 'Title', 'Department', 'Company', 'TelephoneNumber', 'UPN']
+
+_WHITESPACE_RE = re.compile(r"\s+")
+# Hungarian endings that may be glued to a unit name: an optional possessive
+# vowel ("Hivatal-a", "Intézet-e") followed by an optional case ending
+# ("Karon", "Intézetben", "Hivatalában")
+_UNIT_SUFFIX_RE = re.compile(
+    r"(?:j?[aáeé])?"
+    r"(?:n|on|en|ön|an|ban|ben|ba|be|ból|ből|ra|re|ról|ről|nál|nél|hoz|hez|höz|"
+    r"tól|től|nak|nek|t|ot|et|at|i|ig|val|vel)?"
+)
+_WORD_RE = re.compile(r"\w*")
+
+
+def normalize_unit_name(name: str) -> str:
+    """Normalize a unit name for case- and whitespace-insensitive lookup."""
+    return _WHITESPACE_RE.sub(" ", name).strip().lower()
+
+
+def _mentions(text: str, key: str) -> bool:
+    """
+    Whether a normalized unit name occurs in a text as whole words.
+
+    The name must start at a word boundary and end at one, optionally
+    followed by a Hungarian ending, so "kar" matches "karon" but not
+    "karbantartás".
+    """
+    start = text.find(key)
+    while start != -1:
+        if start == 0 or not text[start - 1].isalnum():
+            rest = _WORD_RE.match(text, start + len(key)).group()
+            if _UNIT_SUFFIX_RE.fullmatch(rest):
+                return True
+        start = text.find(key, start + 1)
+    return False
+
+
+def normalize_unit_path(path: str) -> str:
+    """Normalize a slash-separated unit path component by component."""
+    return "/".join(normalize_unit_name(p) for p in path.split("/") if p.strip())
+
+
+def parse_ou_path(ou_path: str) -> List[str]:
+    """
+    Split an organizational unit path into components, root first.
+
+    Handles AD distinguished names ("OU=Dept,OU=Faculty,DC=uni,DC=hu"),
+    where only the OU components are kept and reversed, as well as
+    slash-separated paths ("Faculty/Dept").
+
+    Args:
+        ou_path: OUPath value from the directory export
+
+    Returns:
+        List of unit names from the top of the hierarchy down
+    """
+    if not ou_path:
+        return []
+    if "=" in ou_path:
+        parts = []
+        for rdn in re.split(r"(?<!\\),", ou_path):
+            key, _, value = rdn.partition("=")
+            if key.strip().upper() == "OU" and value.strip():
+                parts.append(value.strip().replace("\\,", ","))
+        return list(reversed(parts))
+    return [p.strip() for p in re.split(r"[/\\]", ou_path) if p.strip()]
+
+
+class OrgNode:
+    """A unit in the organizational tree."""
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.children: Dict[str, "OrgNode"] = {}
+        self.member_ids: List[str] = []  # Direct members
+        self.subtree_ids: List[str] = []  # Members in the whole subtree
+        self.count = 0                   # Members in the whole subtree
+
+    def to_dict(self, depth: Optional[int] = None) -> Dict[str, Any]:
+        """Serialize the node (and its children up to ``depth`` levels) with counts."""
+        result = {
+            "name": self.name,
+            "path": self.path,
+            "count": self.count,
+            "direct_count": len(self.member_ids),
+        }
+        if depth is None or depth > 0:
+            next_depth = None if depth is None else depth - 1
+            result["children"] = [
+                child.to_dict(next_depth)
+                for child in sorted(self.children.values(), key=lambda n: n.name)
+            ]
+        return result
+
+
+class _OrgState:
+    """Immutable snapshot of the index, swapped in atomically on rebuild."""
+
+    def __init__(
+        self,
+        root: OrgNode,
+        people: Dict[str, Dict[str, str]],
+        units: Dict[str, Dict[str, Any]],
+        nodes: Dict[str, OrgNode]
+    ):
+        self.root = root
+        self.people = people
+        self.units = units  # By normalized name (merges same-named units)
+        self.nodes = nodes  # OU tree nodes by normalized path
+
+
+class OrgIndex:
+    """
+    Organizational hierarchy with member counts and id lists per unit.
+
+    Units are the OU tree nodes plus every distinct Company and Department
+    value. Looked up by name, a unit may match several of them (e.g. a
+    faculty that is both a Company value and an OU, or the "Dékáni Hivatal"
+    of every faculty), in which case their members are merged. Looked up
+    by path ("Kar/Dékáni Hivatal"), a unit is exactly one OU tree node.
+    """
+
+    def __init__(self):
+        self._state = _OrgState(OrgNode("", ""), {}, {}, {})
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether the index holds any members."""
+        return bool(self._state.people)
+
+    def rebuild(self, records: Iterable[Tuple[str, Dict[str, Any]]]):
+        """
+        Rebuild the index from (document id, metadata) pairs.
+
+        Args:
+            records: Iterable of (doc_id, metadata) tuples
+        """
+        root = OrgNode("", "")
+        people: Dict[str, Dict[str, str]] = {}
+        units: Dict[str, Dict[str, Any]] = {}
+        nodes: Dict[str, OrgNode] = {}
+
+        def add_to_unit(name: str, kind: str, doc_id: str):
+            key = normalize_unit_name(name)
+            if not key:
+                return
+            unit = units.setdefault(key, {"name": name, "kinds": set(), "ids": [], "values": {}})
+            unit["kinds"].add(kind)
+            unit["ids"].append(doc_id)
+            unit["values"].setdefault(kind, set()).add(name)
+
+        for doc_id, metadata in records:
+            if doc_id in people:
+                continue
+            people[doc_id] = {field: metadata.get(field, "") or "" for field in MEMBER_FIELDS}
+
+            path = parse_ou_path(metadata.get("OUPath", ""))
+            if not path:
+                path = [p for p in (metadata.get("Company"), metadata.get("Department")) if p]
+
+            node = root
+            node.count += 1
+            for name in path:
+                child = node.children.get(name)
+                if child is None:
+                    child_path = f"{node.path}/{name}" if node.path else name
+                    child = node.children[name] = OrgNode(name, child_path)
+                    nodes.setdefault(normalize_unit_path(child_path), child)
+                child.count += 1
+                child.subtree_ids.append(doc_id)
+                add_to_unit(name, "ou", doc_id)
+                node = child
+            node.member_ids.append(doc_id)
+
+            if metadata.get("Company"):
+                add_to_unit(metadata["Company"], "company", doc_id)
+            if metadata.get("Department"):
+                add_to_unit(metadata["Department"], "department", doc_id)
+
+        # De-duplicate merged id lists and order members by name
+        for unit in units.values():
+            unique_ids = set(unit["ids"])
+            unit["ids"] = sorted(unique_ids, key=lambda i: people[i]["DisplayName"].lower())
+        for node in nodes.values():
+            node.subtree_ids.sort(key=lambda i: people[i]["DisplayName"].lower())
+
+        self._state = _OrgState(root, people, units, nodes)
+        print(f"Org index built: {len(people)} people, {len(units)} units")
+
+    def tree(self, depth: Optional[int] = 2) -> Dict[str, Any]:
+        """Serialize the hierarchy with member counts."""
+        return self._state.root.to_dict(depth)
+
+    def find_units(self, text: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Find units whose name contains ``text``.
+
+        Args:
+            text: Substring to look for (case-insensitive)
+            limit: Maximum number of units to return
+
+        Returns:
+            List of {"name", "kinds", "count"} dictionaries, largest first
+        """
+        needle = normalize_unit_name(text)
+        matches = [
+            unit for key, unit in self._state.units.items()
+            if needle in key
+        ]
+        matches.sort(key=lambda u: len(u["ids"]), reverse=True)
+        return [
+            {"name": unit["name"], "kinds": sorted(unit["kinds"]), "count": len(unit["ids"])}
+            for unit in matches[:limit]
+        ]
+
+    def match_unit(self, query: str, kinds: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find the unit mentioned in a free-text query.
+
+        OU tree nodes are tried first: among the nodes whose name occurs in
+        the query, the one with the most path components mentioned wins,
+        then the deepest, so "Neumann János Informatikai Kar Dékáni
+        Hivatalában" resolves to that faculty's dean's office. If no node
+        or several equally good ones match, the longest unit name that
+        occurs in the query is used (so "Kar-on" matches the faculty rather
+        than a shorter unit contained in its name). Names must occur as
+        whole words (see _mentions).
+
+        Args:
+            query: User's query
+            kinds: Only consider units of these kinds ("ou", "company", "department");
+                OU paths are only matched when "ou" is included
+
+        Returns:
+            {"name": unit name, "path": OU path or None}, or None if no unit is mentioned
+        """
+        state = self._state
+        text = normalize_unit_name(query)
+        wanted = set(kinds) if kinds is not None else None
+        mentioned: Dict[str, bool] = {}
+
+        def is_mentioned(key: str) -> bool:
+            if key not in mentioned:
+                mentioned[key] = len(key) >= 3 and _mentions(text, key)
+            return mentioned[key]
+
+        if wanted is None or "ou" in wanted:
+            best_score, best_nodes = None, []
+            for path_key, node in state.nodes.items():
+                components = path_key.split("/")
+                if not is_mentioned(components[-1]):
+                    continue
+                score = (sum(1 for c in components if is_mentioned(c)), len(components))
+                if best_score is None or score > best_score:
+                    best_score, best_nodes = score, [node]
+                elif score == best_score:
+                    best_nodes.append(node)
+            if len(best_nodes) == 1:
+                return {"name": best_nodes[0].name, "path": best_nodes[0].path}
+
+        best = None
+        for key, unit in state.units.items():
+            if wanted is not None and not (unit["kinds"] & wanted):
+                continue
+            if (best is None or len(key) > len(best[0])) and is_mentioned(key):
+                best = (key, unit["name"])
+        return {"name": best[1], "path": None} if best else None
+
+    def stored_values(self, unit: str, kind: str) -> List[str]:
+        """
+        Exact field values stored for a unit name, e.g. the Company spellings.
+
+        Args:
+            unit: Unit name in any case/whitespace form
+            kind: Field kind ("ou", "company" or "department")
+
+        Returns:
+            Sorted distinct values, empty if the unit is unknown for that kind
+        """
+        entry = self._state.units.get(normalize_unit_name(unit))
+        return sorted(entry["values"].get(kind, ())) if entry else []
+
+    def _members(self, unit: Optional[str], path: Optional[str]) -> Optional[Tuple[Dict[str, Any], List[str]]]:
+        """Unit description and member ids by path (exact node) or by name (merged)."""
+        state = self._state
+        if path:
+            node = state.nodes.get(normalize_unit_path(path))
+            return ({"unit": node.name, "path": node.path}, node.subtree_ids) if node else None
+        entry = state.units.get(normalize_unit_name(unit or ""))
+        return ({"unit": entry["name"], "path": None}, entry["ids"]) if entry else None
+
+    def count(self, unit: Optional[str] = None, path: Optional[str] = None) -> Optional[int]:
+        """Number of members of a unit (by name or OU path), or None if the unit is unknown."""
+        found = self._members(unit, path)
+        return len(found[1]) if found else None
+
+    def list_members(
+        self,
+        unit: Optional[str] = None,
+        page: int = 1,
+        page_size: int = 50,
+        path: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        List the members of a unit, ordered by name, one page at a time.
+
+        Args:
+            unit: Unit name (OU, Company or Department); same-named units are merged
+            page: 1-based page number
+            page_size: Members per page
+            path: OU path ("Kar/Dékáni Hivatal"); selects exactly one node and
+                takes precedence over ``unit``
+
+        Returns:
+            Dictionary with unit, path, total, page, page_size and items,
+            or None if the unit is unknown
+        """
+        found = self._members(unit, path)
+        if found is None:
+            return None
+        info, all_ids = found
+        start = (max(page, 1) - 1) * page_size
+        ids = all_ids[start:start + page_size]
+        people = self._state.people
+        return {
+            **info,
+            "total": len(all_ids),
+            "page": max(page, 1),
+            "page_size": page_size,
+            "items": [{"id": doc_id, **people[doc_id]} for doc_id in ids],
+        }
@@ -1,6 +1,6 @@
 """Query preprocessing and optimization utilities."""
 import re
-from typing import List
+from typing import List, Optional
 import unicodedata
 
 # Hungarian character normalization map
@@ -109,3 +109,60 @@ def preprocess_query(query: str, use_synonyms: bool = False) -> str:
     
     return processed
 
+
+# Phrases that ask for a membership list or a head count rather than a person
+LISTING_PATTERNS = {
+    'count': [
+        r'\bhányan\b', r'\bhány (ember|munkatárs|dolgozó|fő|személy|oktató)',
+        r'\bhow many (people|staff|employees|members|persons)\b',
+        r'\blétszám', r'\bnumber of (people|staff|employees|members)\b',
+    ],
+    'list': [
+        r'\bkik dolgoznak\b', r'\bkik tartoznak\b',
+        r'\b(sorold fel|listázd)\b.*\b(munkatárs|dolgozó|tag|oktató|ember|mindenki)',
+        r'\b(az )?összes (munkatárs|dolgozó|oktató)', r'\bminden munkatárs',
+        r'\bwho works (at|in|for)\b', r'\blist (all )?(the )?(people|staff|employees|members)\b',
+        r'\ball (people|staff|employees|members)\b', r'\bmembers of\b',
+        r'\b(everyone|everybody|all) (who works )?(in|at|from)\b',
+        r'\b(list|show)( me)? (everyone|everybody)\b',
+    ],
+}
+# Roles and titles: a listing question that names one ("who are the deans at X")
+# is a lookup for specific people and goes through the regular pipeline
+ROLE_PATTERN = re.compile(
+    r'\b(dékán|dean|rektor|rector|vezető|vezetője|head|igazgató|director|titkár|secretary|'
+    r'professzor|professor|docens|adjunktus|tanársegéd|lecturer|elnök|chair|president|'
+    r'helyettes|deputy|koordinátor|coordinator|manager|ügyintéző|referens)'
+)
+_LISTING_REGEXES = {
+    intent: [re.compile(p) for p in patterns]
+    for intent, patterns in LISTING_PATTERNS.items()
+}
+
+def mentions_role(text: str) -> bool:
+    """
+    Check whether a text names a role or title (dean, head, secretary, ...).
+    
+    Args:
+        text: Query string (or part of it)
+        
+    Returns:
+        True if a role or title occurs in the text
+    """
+    return ROLE_PATTERN.search(normalize_query(text)) is not None
+
+def detect_listing_intent(query: str) -> Optional[str]:
+    """
+    Detect whether a query asks for a membership list or a count.
+    
+    Args:
+        query: Query string
+        
+    Returns:
+        "count", "list", or None for ordinary lookup queries
+    """
+    normalized = normalize_query(query)
+    for intent in ('count', 'list'):
+        if any(regex.search(normalized) for regex in _LISTING_REGEXES[intent]):
+            return intent
+    return None
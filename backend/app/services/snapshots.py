@@ -0,0 +1,210 @@
+"""Local catalog of collection snapshots for fast bootstrap of new replicas."""
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+from app.config import settings
+
+MANIFEST_FILE = "manifest.json"
+
+
+def expected_vector_size(model_name: str) -> Optional[int]:
+    """
+    Embedding dimension of a fastembed model, without loading the model.
+
+    Args:
+        model_name: fastembed model name
+
+    Returns:
+        Vector size, or None if the model is not in fastembed's model list
+    """
+    try:
+        from fastembed import TextEmbedding
+        for model in TextEmbedding.list_supported_models():
+            if model["model"] == model_name:
+                return model["dim"]
+    except Exception:
+        pass
+    return None
+
+
+class SnapshotManager:
+    """
+    Creates, lists and restores snapshots of the vector store.
+
+    Each snapshot is a directory under SNAPSHOT_DIR holding one Qdrant
+    snapshot file per physical collection (several in partitioned mode)
+    and a manifest with the embedding model and vector size, which are
+    checked before a snapshot is restored.
+    """
+
+    def __init__(self, vector_store, directory: Optional[str] = None, keep: Optional[int] = None):
+        """
+        Initialize the manager.
+
+        Args:
+            vector_store: VectorStore to snapshot and restore
+            directory: Local snapshot directory (default: settings.SNAPSHOT_DIR)
+            keep: Number of snapshots to keep (default: settings.SNAPSHOT_KEEP)
+        """
+        self.vector_store = vector_store
+        self.directory = directory or settings.SNAPSHOT_DIR
+        self.keep = keep if keep is not None else settings.SNAPSHOT_KEEP
+
+    @property
+    def enabled(self) -> bool:
+        """Whether snapshots are supported by the configured Qdrant."""
+        return self.vector_store.supports_snapshots
+
+    def _read_manifest(self, snapshot_id: str) -> Optional[Dict[str, Any]]:
+        if not snapshot_id or os.path.basename(snapshot_id) != snapshot_id or snapshot_id.startswith("."):
+            return None
+        try:
+            with open(os.path.join(self.directory, snapshot_id, MANIFEST_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def incompatibility(self, manifest: Dict[str, Any]) -> Optional[str]:
+        """
+        Check whether a snapshot can be restored into the current configuration.
+
+        Args:
+            manifest: Snapshot manifest
+
+        Returns:
+            Reason the snapshot is incompatible, or None if it can be restored
+        """
+        if manifest.get("embedding_model") != settings.EMBEDDING_MODEL:
+            return f"embedding model {manifest.get('embedding_model')} != {settings.EMBEDDING_MODEL}"
+        vector_size = expected_vector_size(settings.EMBEDDING_MODEL)
+        if vector_size is not None and manifest.get("vector_size") != vector_size:
+            return f"vector size {manifest.get('vector_size')} != {vector_size}"
+        if manifest.get("collection_name") != self.vector_store.collection_name:
+            return f"collection {manifest.get('collection_name')} != {self.vector_store.collection_name}"
+        if manifest.get("sharded") != self.vector_store.sharded:
+            return "partitioning mode differs"
+        for collection in manifest.get("collections", []):
+            if not os.path.exists(os.path.join(self.directory, manifest["id"], collection["file"])):
+                return f"missing file {collection['file']}"
+        return None
+
+    def list(self) -> List[Dict[str, Any]]:
+        """
+        All local snapshots, newest first.
+
+        Returns:
+            Manifests, each with "compatible" and "incompatible_reason" added
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        manifests = []
+        for snapshot_id in os.listdir(self.directory):
+            manifest = self._read_manifest(snapshot_id)
+            if manifest is None:
+                continue
+            reason = self.incompatibility(manifest)
+            manifests.append({**manifest, "compatible": reason is None, "incompatible_reason": reason})
+        manifests.sort(key=lambda m: m.get("created_at", 0), reverse=True)
+        return manifests
+
+    def create(self) -> Dict[str, Any]:
+        """
+        Snapshot every physical collection and store the files locally.
+
+        Returns:
+            Manifest of the new snapshot
+        """
+        collections = self.vector_store.existing_collections()
+        if not collections:
+            raise LookupError("Collection does not exist")
+
+        created_at = time.time()
+        snapshot_id = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(created_at)) + "-" + uuid.uuid4().hex[:6]
+        target_dir = os.path.join(self.directory, snapshot_id)
+        os.makedirs(target_dir)
+
+        try:
+            entries = []
+            for name in collections:
+                file_name = f"{name}.snapshot"
+                size = self.vector_store.download_snapshot(name, os.path.join(target_dir, file_name))
+                points_count = self.vector_store.client.count(collection_name=name).count
+                entries.append({"name": name, "file": file_name, "size": size, "points_count": points_count})
+
+            manifest = {
+                "id": snapshot_id,
+                "created_at": created_at,
+                "embedding_model": settings.EMBEDDING_MODEL,
+                "vector_size": self.vector_store.collection_vector_size(collections[0]),
+                "collection_name": self.vector_store.collection_name,
+                "sharded": self.vector_store.sharded,
+                "points_count": sum(e["points_count"] for e in entries),
+                "collections": entries,
+            }
+            # Written last, so a directory without a manifest is an incomplete snapshot
+            with open(os.path.join(target_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+        except Exception:
+            shutil.rmtree(target_dir, ignore_errors=True)
+            raise
+
+        print(f"Snapshot {snapshot_id} created ({manifest['points_count']} points, {len(entries)} collection(s))")
+        self._prune()
+        return manifest
+
+    def restore(self, snapshot_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Replace the vector store contents with a local snapshot.
+
+        Each collection of the snapshot is uploaded over the live one before
+        anything is deleted, so if an upload fails the store keeps serving
+        the previous data (in partitioned mode, collections restored before
+        the failure already hold the snapshot contents).
+
+        Args:
+            snapshot_id: Snapshot to restore (default: the newest compatible one)
+
+        Returns:
+            Manifest of the restored snapshot
+
+        Raises:
+            LookupError: If the snapshot does not exist (or no compatible one does)
+            ValueError: If the requested snapshot is incompatible
+        """
+        if snapshot_id is None:
+            manifest = next((m for m in self.list() if m["compatible"]), None)
+            if manifest is None:
+                raise LookupError("No compatible snapshot found")
+        else:
+            manifest = self._read_manifest(snapshot_id)
+            if manifest is None:
+                raise LookupError(f"Unknown snapshot: {snapshot_id}")
+            reason = self.incompatibility(manifest)
+            if reason is not None:
+                raise ValueError(f"Snapshot {snapshot_id} is incompatible: {reason}")
+
+        # Upload first: Qdrant's snapshot recovery replaces each target
+        # collection, so a failed upload leaves the live data in place
+        started = time.time()
+        for collection in manifest["collections"]:
+            self.vector_store.upload_snapshot(
+                collection["name"],
+                os.path.join(self.directory, manifest["id"], collection["file"])
+            )
+        # Only then drop partitions that the snapshot does not contain
+        restored = {collection["name"] for collection in manifest["collections"]}
+        for name in self.vector_store.existing_collections():
+            if name not in restored:
+                self.vector_store.client.delete_collection(name)
+                print(f"Collection '{name}' deleted (not in snapshot {manifest['id']}).")
+        print(f"Snapshot {manifest['id']} restored in {time.time() - started:.1f}s")
+        return manifest
+
+    def _prune(self):
+        """Delete the oldest snapshots beyond ``keep``."""
+        for manifest in self.list()[max(self.keep, 1):]:
+            shutil.rmtree(os.path.join(self.directory, manifest["id"]), ignore_errors=True)
+            print(f"Snapshot {manifest['id']} pruned")
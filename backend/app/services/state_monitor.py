@@ -0,0 +1,125 @@
+"""Background monitor that caches Qdrant connectivity and collection state."""
+import asyncio
+import time
+from typing import Optional, Dict, Any
+from app.config import settings
+
+
+class StateMonitor:
+    """
+    Periodically probes Qdrant in the background and caches the result.
+
+    Request handlers read the cached state instead of issuing their own
+    round-trips. Failed operations call ``request_probe()`` so the cache is
+    refreshed immediately instead of waiting for the next interval.
+    """
+
+    def __init__(self, vector_store, interval: Optional[float] = None):
+        """
+        Initialize the monitor.
+
+        Args:
+            vector_store: VectorStore instance to probe
+            interval: Seconds between probes (default: settings.STATE_PROBE_INTERVAL)
+        """
+        self.vector_store = vector_store
+        self.interval = interval if interval is not None else settings.STATE_PROBE_INTERVAL
+        self.qdrant_connected = False
+        self.collection_exists = False
+        self.points_count: Optional[int] = None
+        self.last_checked: Optional[float] = None
+        self._probe_event: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _probe_sync(self) -> Dict[str, Any]:
+        """Run a single blocking probe against Qdrant."""
+        try:
+            collections = self.vector_store.existing_collections()
+        except Exception:
+            return {"qdrant_connected": False, "collection_exists": False, "points_count": None}
+
+        exists = bool(collections)
+        points_count = None
+        if exists:
+            try:
+                points_count = self.vector_store.count_points()
+            except Exception:
+                points_count = None
+        return {"qdrant_connected": True, "collection_exists": exists, "points_count": points_count}
+
+    async def probe(self):
+        """Probe Qdrant once (in a worker thread) and update the cached state."""
+        loop = asyncio.get_running_loop()
+        state = await loop.run_in_executor(None, self._probe_sync)
+        self.qdrant_connected = state["qdrant_connected"]
+        self.collection_exists = state["collection_exists"]
+        self.points_count = state["points_count"]
+        self.last_checked = time.time()
+
+    async def _run(self):
+        """Probe loop: wait for the interval or an explicit re-probe request."""
+        while True:
+            try:
+                await self.probe()
+            except Exception as e:
+                print(f"Warning: Qdrant state probe failed: {e}")
+            try:
+                await asyncio.wait_for(self._probe_event.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._probe_event.clear()
+
+    def start(self):
+        """Start the background probe loop on the running event loop."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._probe_event = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background probe loop."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def request_probe(self):
+        """
+        Ask the monitor to re-probe as soon as possible.
+
+        Safe to call from worker threads as well as from the event loop.
+        """
+        if self._loop is None or self._probe_event is None or self._loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._probe_event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._probe_event.set)
+
+    def mark_collection_ready(self, points_count: Optional[int] = None):
+        """Record that the collection was (re)created and populated."""
+        self.qdrant_connected = True
+        self.collection_exists = True
+        self.points_count = points_count
+        self.last_checked = time.time()
+
+    def mark_collection_missing(self):
+        """Record that the collection was deleted."""
+        self.collection_exists = False
+        self.points_count = None
+        self.last_checked = time.time()
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether Qdrant is reachable and the collection exists."""
+        return self.qdrant_connected and self.collection_exists
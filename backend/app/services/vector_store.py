@@ -1,33 +1,123 @@
 """Vector store service for Qdrant operations."""
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Callable
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import (
+    Distance, VectorParams, Filter, FieldCondition, MatchValue, MatchAny, FilterSelector
+)
+from concurrent.futures import ThreadPoolExecutor
 from app.config import settings
 from app.services.ingestion import get_document_id
+from app.services.bulk_upload import BulkUploader, IngestionCheckpoint
+import hashlib
+import httpx
+import numpy as np
+import os
+import unicodedata
 import uuid
 import re
 
+# Physical collection names of Company partitions: "<base>__<company slug>"
+PARTITION_SEPARATOR = "__"
+# Opaque scroll offsets in partitioned mode: "<collection>@<point id>"
+PARTITION_OFFSET_SEPARATOR = "@"
+
 class VectorStore:
     """Service for managing vector store operations with Qdrant."""
     
     def __init__(self):
         """Initialize Qdrant client."""
-        self.client = QdrantClient(
-            url=settings.qdrant_url,
-            timeout=300  # Increased timeout for large batch operations
-        )
+        if settings.QDRANT_LOCATION == ":memory:":
+            self.client = QdrantClient(location=":memory:")
+        elif settings.QDRANT_LOCATION:
+            self.client = QdrantClient(path=settings.QDRANT_LOCATION)
+        else:
+            self.client = QdrantClient(
+                url=settings.qdrant_url,
+                timeout=300  # Increased timeout for large batch operations
+            )
         self.collection_name = settings.QDRANT_COLLECTION_NAME
+        # Partition data into one collection per Company
+        self.sharded = settings.QDRANT_SHARD_BY_COMPANY
+        self._vector_size: Optional[int] = None
+        self._fanout_pool = ThreadPoolExecutor(
+            max_workers=settings.QDRANT_FANOUT_WORKERS,
+            thread_name_prefix="qdrant-fanout"
+        )
+        # Optional callback invoked when a Qdrant operation fails (e.g. to trigger a re-probe)
+        self.on_error = None
+    
+    def _report_error(self):
+        """Notify the error callback, if any, that an operation failed."""
+        if self.on_error is not None:
+            try:
+                self.on_error()
+            except Exception:
+                pass
+    
+    def partition_collection(self, company: Optional[str]) -> str:
+        """
+        Physical collection name of a Company partition.
+        
+        The name is an ASCII slug of the Company plus a short hash, so
+        different companies never share a collection.
+        
+        Args:
+            company: Company (faculty) value; empty values share one partition
+            
+        Returns:
+            Collection name
+        """
+        if not company or not company.strip():
+            return f"{self.collection_name}{PARTITION_SEPARATOR}unassigned"
+        # Case- and whitespace-insensitive, so routing by a user-typed name works
+        key = " ".join(company.split()).lower()
+        ascii_name = unicodedata.normalize("NFKD", key).encode("ascii", "ignore").decode("ascii")
+        slug = re.sub(r"[^a-z0-9]+", "_", ascii_name).strip("_")[:40]
+        digest = hashlib.md5(key.encode("utf-8")).hexdigest()[:6]
+        return f"{self.collection_name}{PARTITION_SEPARATOR}{slug}_{digest}"
+    
+    def existing_collections(self) -> List[str]:
+        """
+        Physical collections currently holding this store's data.
+        
+        Returns:
+            The base collection (unpartitioned mode) or all partition
+            collections, sorted by name; raises if Qdrant is unreachable
+        """
+        names = [c.name for c in self.client.get_collections().collections]
+        if self.sharded:
+            prefix = self.collection_name + PARTITION_SEPARATOR
+            return sorted(name for name in names if name.startswith(prefix))
+        return [self.collection_name] if self.collection_name in names else []
     
-    def create_collection(self, vector_size: int = 1024):
+    def count_points(self) -> int:
+        """Approximate number of points across all physical collections."""
+        return sum(
+            self.client.count(collection_name=name, exact=False).count
+            for name in self.existing_collections()
+        )
+    
+    def create_collection(self, vector_size: int = 1024, collection_name: Optional[str] = None):
         """
         Create a new collection in Qdrant with optimized configuration.
         
+        In partitioned mode, calling this without a collection name only
+        records the vector size; partitions are created on first upsert,
+        once their Company is known.
+        
         Args:
             vector_size: Size of the embedding vectors
+            collection_name: Physical collection to create (default: the base collection)
         """
+        self._vector_size = vector_size
+        if collection_name is None:
+            if self.sharded:
+                return
+            collection_name = self.collection_name
+        
         try:
             self.client.create_collection(
-                collection_name=self.collection_name,
+                collection_name=collection_name,
                 vectors_config=VectorParams(
                     size=vector_size,
                     distance=Distance.COSINE
@@ -37,12 +127,12 @@ class VectorStore:
                     "memmap_threshold": 20000,     # Use memmap for large collections
                 }
             )
-            print(f"Collection '{self.collection_name}' created successfully.")
+            print(f"Collection '{collection_name}' created successfully.")
             
             # Create payload indexes for common filter fields
             try:
                 self.client.create_payload_index(
-                    collection_name=self.collection_name,
+                    collection_name=collection_name,
                     field_name="Department",
                     field_schema="keyword"
                 )
@@ -53,7 +143,7 @@ class VectorStore:
             
             try:
                 self.client.create_payload_index(
-                    collection_name=self.collection_name,
+                    collection_name=collection_name,
                     field_name="Company",
                     field_schema="keyword"
                 )
@@ -64,15 +154,14 @@ class VectorStore:
                     
         except Exception as e:
             if "already exists" in str(e).lower():
-                print(f"Collection '{self.collection_name}' already exists.")
+                print(f"Collection '{collection_name}' already exists.")
             else:
                 raise
     
     def collection_exists(self) -> bool:
-        """Check if the collection exists."""
+        """Check if the collection (or, in partitioned mode, any partition) exists."""
         try:
-            collections = self.client.get_collections()
-            return any(c.name == self.collection_name for c in collections.collections)
+            return bool(self.existing_collections())
         except Exception:
             return False
     
@@ -86,52 +175,84 @@ class VectorStore:
     
     def upsert_documents(
         self,
-        embeddings: List[List[float]],
+        embeddings: np.ndarray,
         documents: List[str],
         metadatas: List[Dict[str, Any]],
-        batch_size: int = 100
+        batch_size: Optional[int] = None,
+        progress: Optional[Callable[[int], None]] = None,
+        collection_name: Optional[str] = None,
+        checkpoint: Optional[IngestionCheckpoint] = None
     ):
         """
         Insert or update documents in the collection in batches.
         
+        Each batch is sent as one columnar ``Batch`` (ids, vectors, payloads)
+        sliced from the embedding matrix, rather than as per-point structs.
+        Several batches are in flight at once (see ``BulkUploader``); with a
+        checkpoint, rows acknowledged by an earlier interrupted run are
+        skipped. In partitioned mode documents are grouped by Company and
+        each group goes to its partition collection (created if needed).
+        
         Args:
-            embeddings: List of embedding vectors
+            embeddings: Embedding matrix of shape (documents, vector size)
             documents: List of document texts
             metadatas: List of metadata dictionaries
-            batch_size: Number of documents to insert per batch (default: 100)
+            batch_size: Initial number of documents per batch (default: settings.QDRANT_UPLOAD_BATCH_SIZE)
+            progress: Optional callback receiving the number of documents inserted so far
+            collection_name: Physical collection to write to (default: routed automatically)
+            checkpoint: Optional checkpoint of completed row ranges, for resuming
         """
-        total_docs = len(embeddings)
-        print(f"Inserting {total_docs} documents in batches of {batch_size}...")
-        
-        # Process in batches to avoid timeout
-        for batch_start in range(0, total_docs, batch_size):
-            batch_end = min(batch_start + batch_size, total_docs)
-            batch_points = []
-            
-            for i in range(batch_start, batch_end):
-                # Use deterministic ID for deduplication
-                doc_id = get_document_id(metadatas[i])
-                
-                point = PointStruct(
-                    id=doc_id,
-                    vector=embeddings[i],
-                    payload={
-                        **metadatas[i],
-                        "content": documents[i]
-                    }
-                )
-                batch_points.append(point)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if collection_name is None and self.sharded:
+            groups: Dict[str, List[int]] = {}
+            for i, metadata in enumerate(metadatas):
+                groups.setdefault(self.partition_collection(metadata.get("Company")), []).append(i)
             
-            # Insert batch
-            try:
-                self.client.upsert(
-                    collection_name=self.collection_name,
-                    points=batch_points
+            done = 0
+            for name, indices in groups.items():
+                self.create_collection(
+                    vector_size=self._vector_size or embeddings.shape[1],
+                    collection_name=name
                 )
-                print(f"Inserted batch {batch_start // batch_size + 1} ({batch_end - batch_start} documents) - Progress: {batch_end}/{total_docs} ({100 * batch_end // total_docs}%)")
-            except Exception as e:
-                print(f"Error inserting batch {batch_start // batch_size + 1}: {e}")
-                raise
+                offset = done
+                self.upsert_documents(
+                    embeddings[indices],
+                    [documents[i] for i in indices],
+                    [metadatas[i] for i in indices],
+                    batch_size=batch_size,
+                    progress=(lambda n, offset=offset: progress(offset + n)) if progress else None,
+                    collection_name=name,
+                    checkpoint=checkpoint
+                )
+                done += len(indices)
+            return
+        
+        collection_name = collection_name or self.collection_name
+        total_docs = len(embeddings)
+        uploader = BulkUploader(
+            self.client,
+            collection_name,
+            batch_size=batch_size,
+            # The embedded client is not safe for concurrent writers
+            parallelism=1 if settings.QDRANT_LOCATION else None,
+            checkpoint=checkpoint
+        )
+        print(f"Inserting {total_docs} documents ({uploader.parallelism} batches in flight, "
+              f"initial batch size {uploader.batch_size})...")
+        
+        # Deterministic IDs for deduplication
+        ids = [get_document_id(metadata) for metadata in metadatas]
+        try:
+            uploader.upload(
+                embeddings,
+                ids,
+                lambda i: {**metadatas[i], "content": documents[i]},
+                progress=progress
+            )
+        except Exception as e:
+            print(f"Error inserting documents into '{collection_name}': {e}")
+            self._report_error()
+            raise
         
         print(f"✅ Successfully inserted all {total_docs} documents into collection.")
     
@@ -170,21 +291,76 @@ class VectorStore:
         # Ensure threshold is within valid range for cosine similarity
         return max(-1.0, min(0.9, threshold))
     
+    def _target_collections(self, companies: Optional[List[str]] = None) -> List[str]:
+        """
+        Physical collections a read should go to.
+        
+        Args:
+            companies: Restrict to these Company partitions (partitioned mode only)
+            
+        Returns:
+            Collection names; partitions that do not exist are skipped
+        """
+        if not self.sharded:
+            return [self.collection_name]
+        existing = self.existing_collections()
+        if not companies:
+            return existing
+        wanted = {self.partition_collection(company) for company in companies}
+        return [name for name in existing if name in wanted]
+    
+    def _search_collection(
+        self,
+        collection_name: str,
+        query_embedding: np.ndarray,
+        top_k: int,
+        score_threshold: float,
+        payload_fields: Optional[List[str]],
+        query_filter: Optional[Filter] = None
+    ) -> List[Dict[str, Any]]:
+        """Search a single physical collection."""
+        results = self.client.search(
+            collection_name=collection_name,
+            query_vector=query_embedding,
+            query_filter=query_filter,
+            limit=top_k,
+            score_threshold=score_threshold,
+            with_payload=payload_fields if payload_fields is not None else True
+        )
+        
+        search_results = []
+        for result in results:
+            payload = result.payload or {}
+            search_results.append({
+                "score": result.score,
+                "metadata": payload,
+                "content": payload.get("content", "")
+            })
+        return search_results
+    
     def search(
         self,
-        query_embedding: List[float],
+        query_embedding: np.ndarray,
         top_k: int = 5,
         score_threshold: Optional[float] = None,
-        query_text: Optional[str] = None
+        query_text: Optional[str] = None,
+        payload_fields: Optional[List[str]] = None,
+        companies: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
         """
         Search for similar documents with adaptive threshold.
         
+        In partitioned mode the search goes only to the given companies'
+        partitions, or fans out to all partitions in parallel and merges
+        the best ``top_k`` hits by score.
+        
         Args:
             query_embedding: Query embedding vector
             top_k: Number of results to return
             score_threshold: Minimum similarity score (if None, uses adaptive threshold)
             query_text: Original query text for adaptive threshold calculation
+            payload_fields: Payload fields to fetch (if None, fetches the full payload)
+            companies: Restrict the search to these Company values
             
         Returns:
             List of search results with scores and metadata
@@ -196,33 +372,271 @@ class VectorStore:
             elif score_threshold is None:
                 score_threshold = 0.1  # Default fallback
             
-            results = self.client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding,
-                limit=top_k,
-                score_threshold=score_threshold
-            )
+            if not self.sharded:
+                query_filter = None
+                if companies:
+                    query_filter = Filter(must=[
+                        FieldCondition(key="Company", match=MatchAny(any=list(companies)))
+                    ])
+                return self._search_collection(
+                    self.collection_name, query_embedding, top_k,
+                    score_threshold, payload_fields, query_filter
+                )
             
-            search_results = []
-            for result in results:
-                search_results.append({
-                    "score": result.score,
-                    "metadata": result.payload,
-                    "content": result.payload.get("content", "")
-                })
+            targets = self._target_collections(companies)
+            if len(targets) == 1:
+                return self._search_collection(
+                    targets[0], query_embedding, top_k, score_threshold, payload_fields
+                )
             
-            return search_results
+            futures = [
+                self._fanout_pool.submit(
+                    self._search_collection, name, query_embedding, top_k,
+                    score_threshold, payload_fields
+                )
+                for name in targets
+            ]
+            merged = [hit for future in futures for hit in future.result()]
+            merged.sort(key=lambda hit: hit["score"], reverse=True)
+            return merged[:top_k]
         except Exception as e:
             print(f"Error during search: {e}")
+            self._report_error()
             import traceback
             traceback.print_exc()
             return []
     
+    def build_filter(
+        self,
+        department: Optional[str] = None,
+        companies: Optional[List[str]] = None
+    ) -> Optional[Filter]:
+        """
+        Build a payload filter on the indexed Department/Company fields.
+        
+        Args:
+            department: Exact Department value to match
+            companies: Exact Company values, any of which matches
+            
+        Returns:
+            Qdrant filter, or None if no condition was given
+        """
+        conditions = []
+        if department:
+            conditions.append(FieldCondition(key="Department", match=MatchValue(value=department)))
+        if companies:
+            conditions.append(FieldCondition(key="Company", match=MatchAny(any=list(companies))))
+        return Filter(must=conditions) if conditions else None
+    
+    def scroll_page(
+        self,
+        limit: int = 500,
+        offset: Optional[str] = None,
+        scroll_filter: Optional[Filter] = None,
+        payload_fields: Optional[List[str]] = None,
+        companies: Optional[List[str]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Fetch one page of points (payload only, no vectors) in id order.
+        
+        In partitioned mode the partitions are walked one after another and
+        the returned offset is an opaque "<collection>@<point id>" token; a
+        plain point id is also accepted and located in its partition.
+        
+        Args:
+            limit: Maximum number of points in the page
+            offset: Point id to start from (inclusive), None for the beginning
+            scroll_filter: Optional payload filter
+            payload_fields: Payload fields to fetch (if None, fetches the full payload)
+            companies: Restrict to these Company partitions (partitioned mode only)
+            
+        Returns:
+            Tuple of (records, next_offset) where each record is the payload
+            plus its point "id", and next_offset is None after the last page
+        """
+        with_payload = payload_fields if payload_fields is not None else True
+        try:
+            if not self.sharded:
+                points, next_offset = self.client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=scroll_filter,
+                    limit=limit,
+                    offset=offset,
+                    with_payload=with_payload,
+                    with_vectors=False
+                )
+                records = [{"id": str(point.id), **(point.payload or {})} for point in points]
+                return records, (str(next_offset) if next_offset is not None else None)
+            
+            partitions = self._target_collections(companies)
+            index, point_offset = self._locate_offset(partitions, offset)
+            while index < len(partitions):
+                name = partitions[index]
+                points, next_offset = self.client.scroll(
+                    collection_name=name,
+                    scroll_filter=scroll_filter,
+                    limit=limit,
+                    offset=point_offset,
+                    with_payload=with_payload,
+                    with_vectors=False
+                )
+                if points or next_offset is not None:
+                    records = [{"id": str(point.id), **(point.payload or {})} for point in points]
+                    if next_offset is not None:
+                        token = f"{name}{PARTITION_OFFSET_SEPARATOR}{next_offset}"
+                    elif index + 1 < len(partitions):
+                        token = f"{partitions[index + 1]}{PARTITION_OFFSET_SEPARATOR}"
+                    else:
+                        token = None
+                    return records, token
+                index, point_offset = index + 1, None
+            return [], None
+        except Exception:
+            self._report_error()
+            raise
+    
+    def _locate_offset(self, partitions: List[str], offset: Optional[str]) -> Tuple[int, Optional[str]]:
+        """
+        Resolve a partitioned scroll offset to (partition index, point offset).
+        
+        Args:
+            partitions: Sorted partition collection names
+            offset: None, an opaque "<collection>@<point id>" token or a plain point id
+            
+        Returns:
+            Tuple of (index into partitions, point id to start from or None)
+            
+        Raises:
+            LookupError: If a plain point id is not found in any partition
+        """
+        if offset is None:
+            return 0, None
+        if PARTITION_OFFSET_SEPARATOR in offset:
+            name, _, point_id = offset.partition(PARTITION_OFFSET_SEPARATOR)
+            if name in partitions:
+                return partitions.index(name), point_id or None
+            # Partition gone since the token was issued: continue with the next one
+            return sum(1 for p in partitions if p < name), None
+        for index, name in enumerate(partitions):
+            if self.client.retrieve(collection_name=name, ids=[offset], with_payload=False):
+                return index, offset
+        raise LookupError(f"Unknown point id: {offset}")
+    
+    def delete_partition(self, companies: List[str]):
+        """
+        Remove all documents of one Company.
+        
+        Drops the partition collection in partitioned mode, otherwise deletes
+        the matching points from the single collection.
+        
+        Args:
+            companies: Exact stored Company values of the faculty (all
+                spellings that normalize to the same name; "" for documents
+                without one)
+        """
+        try:
+            if self.sharded:
+                existing = self.existing_collections()
+                for name in {self.partition_collection(company) for company in companies}:
+                    if name in existing:
+                        self.client.delete_collection(name)
+                        print(f"Collection '{name}' deleted.")
+            elif self.collection_exists():
+                self.client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=FilterSelector(filter=Filter(must=[
+                        FieldCondition(key="Company", match=MatchAny(any=list(companies)))
+                    ]))
+                )
+                print(f"Documents of {companies} deleted from '{self.collection_name}'.")
+        except Exception as e:
+            print(f"Error deleting partition: {e}")
+            self._report_error()
+            raise
+    
+    @property
+    def supports_snapshots(self) -> bool:
+        """Snapshots are only available from a Qdrant server, not the embedded client."""
+        return not settings.QDRANT_LOCATION
+    
+    def collection_vector_size(self, collection_name: Optional[str] = None) -> Optional[int]:
+        """
+        Vector size of a physical collection.
+        
+        Args:
+            collection_name: Collection to inspect (default: the base collection)
+            
+        Returns:
+            Vector size, or None if it cannot be determined
+        """
+        try:
+            info = self.client.get_collection(collection_name or self.collection_name)
+            return info.config.params.vectors.size
+        except Exception:
+            # Older servers may fail response validation; fall back to the last known size
+            return self._vector_size
+    
+    def download_snapshot(self, collection_name: str, target_path: str) -> int:
+        """
+        Create a snapshot of a collection on the server and download it.
+        
+        The server-side copy is deleted afterwards so snapshots do not pile
+        up in Qdrant's storage.
+        
+        Args:
+            collection_name: Physical collection to snapshot
+            target_path: Local file to write the snapshot to
+            
+        Returns:
+            Size of the snapshot file in bytes
+        """
+        description = self.client.create_snapshot(collection_name=collection_name)
+        url = f"{settings.qdrant_url}/collections/{collection_name}/snapshots/{description.name}"
+        partial_path = target_path + ".part"
+        try:
+            with httpx.stream("GET", url, timeout=300) as response:
+                response.raise_for_status()
+                with open(partial_path, "wb") as out:
+                    for chunk in response.iter_bytes(1024 * 1024):
+                        out.write(chunk)
+            os.replace(partial_path, target_path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            try:
+                self.client.delete_snapshot(collection_name=collection_name, snapshot_name=description.name)
+            except Exception as e:
+                print(f"Warning: could not delete server-side snapshot {description.name}: {e}")
+        return os.path.getsize(target_path)
+    
+    def upload_snapshot(self, collection_name: str, snapshot_path: str):
+        """
+        Restore a collection from a local snapshot file.
+        
+        The file is streamed to the server, which replaces the collection
+        with the snapshot contents (creating it if needed).
+        
+        Args:
+            collection_name: Physical collection to restore
+            snapshot_path: Local snapshot file
+        """
+        url = f"{settings.qdrant_url}/collections/{collection_name}/snapshots/upload"
+        with open(snapshot_path, "rb") as snapshot:
+            response = httpx.post(
+                url,
+                params={"priority": "snapshot", "wait": "true"},
+                files={"snapshot": (os.path.basename(snapshot_path), snapshot, "application/octet-stream")},
+                timeout=None
+            )
+        response.raise_for_status()
+        print(f"Collection '{collection_name}' restored from {snapshot_path}")
+    
     def delete_collection(self):
-        """Delete the collection (use with caution)."""
+        """Delete the collection, or every partition collection (use with caution)."""
         try:
-            self.client.delete_collection(self.collection_name)
-            print(f"Collection '{self.collection_name}' deleted.")
+            names = self.existing_collections() if self.sharded else [self.collection_name]
+            for name in names:
+                self.client.delete_collection(name)
+                print(f"Collection '{name}' deleted.")
         except Exception as e:
             print(f"Error deleting collection: {e}")
-
@@ -0,0 +1,424 @@
+"""Concurrent load-test harness for the phonebook API.
+
+Drives /query, /health and /reindex at increasing concurrency levels with a
+configurable request mix and reports throughput, latency percentiles, error
+rates and the saturation point of each pipeline stage.
+
+Two targets are supported:
+
+  In-process (default): the FastAPI app runs inside this process with an
+  in-memory Qdrant, a synthetic directory, a stub LLM and (unless
+  --real-embeddings is given) a stub embedding model. Event-loop lag is
+  measured directly, so blocking calls on the loop show up immediately.
+
+      python loadtest.py --concurrency 1,4,16,64 --duration 10
+
+  Live server: point it at a running instance.
+
+      python loadtest.py --url http://localhost:8000 --concurrency 1,8,32
+
+Request mix weights are given as name=weight pairs, e.g.
+--mix repeated=3,unique=3,lookup=3,listing=1,health=1. Available kinds:
+repeated (the same question every time; exercises caching and coalescing),
+unique (a different question every time), lookup (a person's contact by
+name), listing (membership/count questions), health and reindex.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Make the 'app' package importable when running from any directory
+backend_dir = Path(__file__).resolve().parent
+if str(backend_dir) not in sys.path:
+    sys.path.insert(0, str(backend_dir))
+
+import httpx
+
+FIRST_NAMES = ["Anna", "Béla", "Csaba", "Dóra", "Erzsébet", "Ferenc", "Gábor", "Hajnalka",
+               "István", "Judit", "Katalin", "László", "Mária", "Norbert", "Orsolya", "Péter"]
+LAST_NAMES = ["Kiss", "Nagy", "Szabó", "Tóth", "Varga", "Kovács", "Horváth", "Molnár",
+              "Németh", "Farkas", "Balogh", "Papp", "Takács", "Juhász", "Lakatos", "Mészáros"]
+TITLES = ["egyetemi tanár", "egyetemi docens", "adjunktus", "tanársegéd", "dékán",
+          "tanszékvezető", "titkárságvezető", "ügyintéző"]
+COMPANIES = ["Neumann János Informatikai Kar", "Kandó Kálmán Villamosmérnöki Kar",
+             "Bánki Donát Gépész és Biztonságtechnikai Mérnöki Kar", "Keleti Károly Gazdasági Kar",
+             "Alba Regia Műszaki Kar"]
+DEPARTMENTS = ["Alkalmazott Informatikai Intézet", "Alkalmazott Matematikai Intézet",
+               "Automatikai Intézet", "Gazdaságtudományi Intézet", "Mechatronikai Intézet",
+               "Dékáni Hivatal"]
+UNIQUE_TOPICS = ["telefonszáma", "email címe", "beosztása", "melyik tanszéken dolgozik",
+                 "hol található az irodája", "ki a helyettese"]
+
+
+# --- Synthetic directory and stubs for in-process runs ----------------------
+
+def write_synthetic_directory(path: str, rows: int, seed: int = 42) -> List[Dict[str, str]]:
+    """Write a synthetic AD export CSV and return its rows."""
+    import csv
+    rng = random.Random(seed)
+    people = []
+    for i in range(rows):
+        name = f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)} {i}"
+        company = rng.choice(COMPANIES)
+        department = rng.choice(DEPARTMENTS)
+        people.append({
+            "DisplayName": name,
+            "Title": rng.choice(TITLES),
+            "Department": department,
+            "Company": company,
+            "TelephoneNumber": f"+36 1 666 {5000 + i}",
+            "UPN": f"user{i}@uni-obuda.hu",
+            "OUPath": f"OU={department},OU={company},OU=Users,DC=uni-obuda,DC=hu",
+        })
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(people[0].keys()))
+        writer.writeheader()
+        writer.writerows(people)
+    return people
+
+
+class StubEmbeddingModel:
+    """Deterministic hash-based vectors with a configurable per-batch latency."""
+
+    def __init__(self, dim: int = 1024, latency: float = 0.01):
+        self.dim = dim
+        self.latency = latency
+
+    def embed(self, documents, batch_size: int = 256):
+        import numpy as np
+        documents = list(documents)
+        for start in range(0, len(documents), batch_size):
+            time.sleep(self.latency)
+            for doc in documents[start:start + batch_size]:
+                seed = int.from_bytes(hashlib.md5(doc.encode("utf-8")).digest()[:4], "little")
+                vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+                yield vector / np.linalg.norm(vector)
+
+
+class StubLLM:
+    """Stands in for LLMEngine: sleeps for a fixed latency and echoes the hits."""
+
+    def __init__(self, latency: float = 0.5):
+        self.latency = latency
+
+    def generate_answer_with_usage(self, query, context, language="hu"):
+        time.sleep(self.latency)
+        names = ", ".join(hit["metadata"].get("DisplayName", "") for hit in context[:3])
+        return f"[stub] {names}", {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+    def stats(self):
+        return {"stub": True, "latency_ms": self.latency * 1000}
+
+
+# --- Request mix --------------------------------------------------------------
+
+class RequestMix:
+    """Builds requests of the configured kinds according to their weights."""
+
+    def __init__(self, weights: Dict[str, float], names: List[str], units: List[str], seed: int = 1):
+        self.kinds = list(weights.keys())
+        self.weights = list(weights.values())
+        self.names = names or ["Kiss Anna"]
+        self.units = units or COMPANIES
+        self.rng = random.Random(seed)
+        self.counter = 0
+
+    def next(self) -> Dict[str, Any]:
+        kind = self.rng.choices(self.kinds, weights=self.weights)[0]
+        self.counter += 1
+        if kind == "repeated":
+            return {"kind": kind, "method": "POST", "path": "/query",
+                    "json": {"query": "Ki a Neumann János Informatikai Kar dékánja?", "language": "hu"}}
+        if kind == "unique":
+            topic = self.rng.choice(UNIQUE_TOPICS)
+            return {"kind": kind, "method": "POST", "path": "/query",
+                    "json": {"query": f"{self.rng.choice(self.names)} {topic}? #{self.counter}", "language": "hu"}}
+        if kind == "lookup":
+            return {"kind": kind, "method": "POST", "path": "/query",
+                    "json": {"query": f"Mi {self.rng.choice(self.names)} telefonszáma?", "language": "hu", "top_k": 3}}
+        if kind == "listing":
+            question = self.rng.choice(["Kik dolgoznak a(z) {}-on?", "Hányan dolgoznak a(z) {}-on?"])
+            return {"kind": kind, "method": "POST", "path": "/query",
+                    "json": {"query": question.format(self.rng.choice(self.units)), "language": "hu"}}
+        if kind == "health":
+            return {"kind": kind, "method": "GET", "path": "/health"}
+        if kind == "reindex":
+            return {"kind": kind, "method": "POST", "path": "/reindex"}
+        raise ValueError(f"Unknown request kind: {kind}")
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse "kind=weight,kind=weight" into a dict."""
+    weights = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        kind, _, weight = part.partition("=")
+        weights[kind.strip()] = float(weight or 1)
+    return weights
+
+
+# --- Measurement ---------------------------------------------------------------
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class LoopLagMonitor:
+    """Measures event-loop lag: how late a 10 ms sleep wakes up."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+async def fetch_stats(client: httpx.AsyncClient) -> Optional[Dict[str, Any]]:
+    """Read /stats (stage queue depths and counters); None if unavailable."""
+    try:
+        response = await client.get("/stats")
+        return response.json() if response.status_code == 200 else None
+    except Exception:
+        return None
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    mix: RequestMix,
+    concurrency: int,
+    duration: float,
+    lag_monitor: Optional[LoopLagMonitor]
+) -> Dict[str, Any]:
+    """Run a closed-loop load at one concurrency level for ``duration`` seconds."""
+    results: List[Dict[str, Any]] = []
+    max_queue_depth: Dict[str, int] = {}
+    stop_at = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < stop_at:
+            request = mix.next()
+            started = time.perf_counter()
+            try:
+                response = await client.request(request["method"], request["path"], json=request.get("json"))
+                status = response.status_code
+            except Exception:
+                status = 0
+            results.append({"kind": request["kind"], "status": status, "latency": time.perf_counter() - started})
+
+    async def sample_stats():
+        while time.perf_counter() < stop_at:
+            stats = await fetch_stats(client)
+            for stage, values in ((stats or {}).get("stages") or {}).items():
+                max_queue_depth[stage] = max(max_queue_depth.get(stage, 0), values.get("queue_depth", 0))
+            await asyncio.sleep(0.25)
+
+    before = await fetch_stats(client)
+    if lag_monitor is not None:
+        lag_monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(sample_stats(), *[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    if lag_monitor is not None:
+        await lag_monitor.stop()
+    after = await fetch_stats(client)
+
+    latencies = [r["latency"] for r in results]
+    ok = [r for r in results if 200 <= r["status"] < 300]
+    shed = [r for r in results if r["status"] in (429, 503)]
+    errors = [r for r in results if not (200 <= r["status"] < 300) and r["status"] not in (429, 503)]
+
+    stages = {}
+    if before and after:
+        for stage, values in (after.get("stages") or {}).items():
+            prev = (before.get("stages") or {}).get(stage, {})
+            stages[stage] = {
+                "admitted": values["admitted"] - prev.get("admitted", 0),
+                "rejected": values["rejected"] - prev.get("rejected", 0) + values["timed_out"] - prev.get("timed_out", 0),
+                "max_queue_depth": max_queue_depth.get(stage, 0),
+                "avg_service_time_ms": values.get("avg_service_time_ms"),
+            }
+
+    by_kind = {}
+    for kind in {r["kind"] for r in results}:
+        kind_latencies = [r["latency"] for r in results if r["kind"] == kind]
+        by_kind[kind] = {"count": len(kind_latencies), "p50_ms": _ms(percentile(kind_latencies, 50)),
+                         "p99_ms": _ms(percentile(kind_latencies, 99))}
+
+    level = {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "throughput_rps": round(len(ok) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p90_ms": _ms(percentile(latencies, 90)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "error_rate": round(len(errors) / len(results), 4) if results else 0.0,
+        "shed_rate": round(len(shed) / len(results), 4) if results else 0.0,
+        "stages": stages,
+        "by_kind": by_kind,
+    }
+    if lag_monitor is not None and lag_monitor.samples:
+        level["loop_lag_p99_ms"] = _ms(percentile(lag_monitor.samples, 99))
+        level["loop_lag_max_ms"] = _ms(max(lag_monitor.samples))
+    return level
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def find_saturation(levels: List[Dict[str, Any]], gain_threshold: float = 0.1) -> Dict[str, Any]:
+    """
+    Locate saturation points.
+
+    The overall saturation point is the first level after which throughput
+    grows by less than ``gain_threshold`` (relative). A stage saturates at the
+    first level where requests queued for it or were rejected.
+    """
+    overall = None
+    for prev, cur in zip(levels, levels[1:]):
+        if prev["throughput_rps"] and cur["throughput_rps"] < prev["throughput_rps"] * (1 + gain_threshold):
+            overall = prev["concurrency"]
+            break
+
+    per_stage = {}
+    for level in levels:
+        for stage, values in level["stages"].items():
+            if stage not in per_stage and (values["max_queue_depth"] > 0 or values["rejected"] > 0):
+                per_stage[stage] = level["concurrency"]
+    return {"throughput_knee_concurrency": overall, "stage_first_queueing_concurrency": per_stage}
+
+
+def print_report(levels: List[Dict[str, Any]], saturation: Dict[str, Any]):
+    """Print a human-readable summary table."""
+    header = f"{'conc':>5} {'reqs':>7} {'rps':>8} {'p50ms':>8} {'p90ms':>8} {'p99ms':>8} {'err%':>6} {'shed%':>6} {'lag99':>7}"
+    print("\n" + header)
+    print("-" * len(header))
+    for level in levels:
+        print(
+            f"{level['concurrency']:>5} {level['requests']:>7} {level['throughput_rps']:>8} "
+            f"{level['p50_ms'] or 0:>8} {level['p90_ms'] or 0:>8} {level['p99_ms'] or 0:>8} "
+            f"{level['error_rate'] * 100:>6.1f} {level['shed_rate'] * 100:>6.1f} "
+            f"{level.get('loop_lag_p99_ms', '-'):>7}"
+        )
+        for stage, values in level["stages"].items():
+            print(
+                f"{'':>5}   {stage:<10} admitted={values['admitted']} rejected={values['rejected']} "
+                f"max_queue={values['max_queue_depth']} svc={values['avg_service_time_ms']}ms"
+            )
+    print(f"\nThroughput knee at concurrency: {saturation['throughput_knee_concurrency'] or 'not reached'}")
+    for stage, concurrency in saturation["stage_first_queueing_concurrency"].items():
+        print(f"Stage '{stage}' starts queueing at concurrency {concurrency}")
+
+
+# --- Targets -------------------------------------------------------------------
+
+async def run_in_process(args, levels: List[int], weights: Dict[str, float]) -> List[Dict[str, Any]]:
+    """Run the app in this process with in-memory Qdrant and stubs."""
+    os.environ["QDRANT_LOCATION"] = ":memory:"
+    os.environ.setdefault("OPENAI_API_KEY", "loadtest")
+    from app.config import settings
+    settings.QDRANT_LOCATION = ":memory:"
+
+    import app.main as main
+    import app.services.ingestion as ingestion
+
+    if not args.real_embeddings:
+        ingestion._embedding_model = StubEmbeddingModel(latency=args.embed_latency)
+    main.llm_engine = StubLLM(latency=args.llm_latency)
+    main.ingestion_completed = True  # The harness loads its own synthetic data
+
+    tmp_dir = tempfile.mkdtemp(prefix="loadtest-")
+    data_path = args.data or os.path.join(tmp_dir, "directory.csv")
+    people = write_synthetic_directory(data_path, args.rows) if not args.data else []
+    settings.DATA_PATH = data_path  # Used by /reindex
+
+    lag_monitor = LoopLagMonitor()
+    async with main.app.router.lifespan_context(main.app):
+        print(f"Loading {args.rows if not args.data else data_path} rows into in-memory Qdrant...")
+        async with main.ingestion_lock:
+            await main._ingest_file(data_path)
+        names = [p["DisplayName"].rsplit(" ", 1)[0] for p in people]
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+            mix = RequestMix(weights, names, COMPANIES)
+            return [await run_level(client, mix, c, args.duration, lag_monitor) for c in levels]
+
+
+async def run_live(args, levels: List[int], weights: Dict[str, float]) -> List[Dict[str, Any]]:
+    """Run against a live server."""
+    limits = httpx.Limits(max_connections=max(levels) + 8, max_keepalive_connections=max(levels) + 8)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        names, units = [], []
+        try:
+            response = await client.get("/directory/export", params={"limit": 500})
+            for line in response.text.splitlines():
+                record = json.loads(line)
+                names.append(record.get("DisplayName", ""))
+                units.append(record.get("Company", ""))
+        except Exception as e:
+            print(f"Warning: could not sample names from /directory/export: {e}")
+        mix = RequestMix(weights, [n for n in names if n], sorted({u for u in units if u}))
+        return [await run_level(client, mix, c, args.duration, None) for c in levels]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for the phonebook API")
+    parser.add_argument("--url", help="Base URL of a live server (default: run the app in-process)")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--mix", default="repeated=3,unique=3,lookup=3,listing=1,health=1",
+                        help="Request mix as kind=weight pairs")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--rows", type=int, default=2000, help="Synthetic directory size (in-process)")
+    parser.add_argument("--data", help="Use this data file instead of a synthetic directory (in-process)")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Stub LLM latency in seconds")
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="Stub embedding latency per batch")
+    parser.add_argument("--real-embeddings", action="store_true", help="Use the real embedding model in-process")
+    parser.add_argument("--json", help="Also write the full report to this JSON file")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    weights = parse_mix(args.mix)
+    runner = run_live if args.url else run_in_process
+    results = asyncio.run(runner(args, levels, weights))
+
+    saturation = find_saturation(results)
+    print_report(results, saturation)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"levels": results, "saturation": saturation}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Listing/count intent detection and unit matching for org-index answers."""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.services.org_index import OrgIndex  # noqa: E402
+from app.services.query_processor import detect_listing_intent, mentions_role  # noqa: E402
+
+FACULTIES = ["Neumann János Informatikai Kar", "Alba Regia Műszaki Kar"]
+DEPARTMENTS = ["Dékáni Hivatal", "Alkalmazott Informatikai Intézet"]
+
+
+@pytest.fixture
+def org_index():
+    records = []
+    for f, faculty in enumerate(FACULTIES):
+        for d, department in enumerate(DEPARTMENTS):
+            for i in range(3):
+                doc_id = f"{f}-{d}-{i}"
+                records.append((doc_id, {
+                    "DisplayName": f"Person {doc_id}",
+                    "Title": "ügyintéző",
+                    "Department": department,
+                    "Company": faculty,
+                    "OUPath": f"OU={department},OU={faculty},OU=Users,DC=uni,DC=hu",
+                }))
+    index = OrgIndex()
+    index.rebuild(records)
+    return index
+
+
+@pytest.mark.parametrize("query, intent", [
+    ("kik dolgoznak a Neumann János Informatikai Kar-on?", "list"),
+    ("list everyone in department Alkalmazott Informatikai Intézet", "list"),
+    ("List everybody at the Alba Regia Műszaki Kar", "list"),
+    ("Sorold fel a Dékáni Hivatal munkatársait", "list"),
+    ("Hányan dolgoznak az Alba Regia Műszaki Karon?", "count"),
+    ("how many people work at Alba Regia Műszaki Kar?", "count"),
+    ("Who are the deans at Alba Regia Műszaki Kar?", None),
+    ("Mi Kovács Anna telefonszáma?", None),
+    ("Kérem a lista elejét", None),
+])
+def test_detect_listing_intent(query, intent):
+    assert detect_listing_intent(query) == intent
+
+
+def test_role_questions_are_not_listings():
+    assert mentions_role("Who are the deans at Alba Regia Műszaki Kar?")
+    assert not mentions_role("kik dolgoznak a Neumann János Informatikai Kar-on?")
+
+
+def test_request_examples_resolve_to_units(org_index):
+    faculty = org_index.match_unit("kik dolgoznak a Neumann János Informatikai Kar-on?")
+    assert faculty["name"] == "Neumann János Informatikai Kar"
+    assert org_index.count(faculty["name"], path=faculty["path"]) == 6
+
+    department = org_index.match_unit("list everyone in department Alkalmazott Informatikai Intézet")
+    assert department["name"] == "Alkalmazott Informatikai Intézet"
+    assert org_index.count(department["name"], path=department["path"]) == 6
+
+
+def test_same_named_units_are_addressed_by_path(org_index):
+    office = org_index.match_unit("kik dolgoznak a Neumann János Informatikai Kar Dékáni Hivatalában?")
+    assert office["path"] == "Users/Neumann János Informatikai Kar/Dékáni Hivatal"
+    members = org_index.list_members(path=office["path"])
+    assert members["total"] == 3
+    assert {m["Company"] for m in members["items"]} == {"Neumann János Informatikai Kar"}
+
+    # By name alone, the dean's offices of all faculties are merged
+    assert org_index.count("Dékáni Hivatal") == 6
+
+
+def test_unit_names_match_on_word_boundaries(org_index):
+    assert org_index.match_unit("Ki a karbantartás vezetője?") is None
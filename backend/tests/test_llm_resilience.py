@@ -0,0 +1,218 @@
+"""
+Resilience tests for LLMEngine against a local fake OpenAI-compatible server.
+
+The engine is pointed at the fake server through OPENAI_BASE_URL; every
+test scripts the server's latency and status code per request.
+
+Run from backend/:  python -m pytest tests
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.config import settings  # noqa: E402
+from app.services.llm_engine import LLMEngine  # noqa: E402
+
+CONTEXT = [{
+    "score": 0.9,
+    "metadata": {
+        "DisplayName": "Kovács Anna",
+        "Title": "dékán",
+        "Company": "Alba Regia Műszaki Kar",
+        "TelephoneNumber": "+36 22 000 000",
+        "UPN": "kovacs.anna@uni.example",
+    },
+}]
+
+
+class FakeOpenAI(ThreadingHTTPServer):
+    """Chat completions endpoint answering with scripted (delay, status) pairs."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.script = []
+        self.default = (0.01, 200)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def next_response(self):
+        with self._lock:
+            self.calls += 1
+            return self.script.pop(0) if self.script else self.default
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("content-length", 0)))
+        delay, status = self.server.next_response()
+        time.sleep(delay)
+        if status == 200:
+            body = {
+                "id": "chatcmpl-test",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "fake",
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": f"answer after {delay}s"},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 4, "total_tokens": 14},
+            }
+        else:
+            body = {"error": {"message": "upstream failure", "type": "server_error"}}
+        data = json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client gave up (timeout or lost hedge race)
+
+
+@pytest.fixture
+def server():
+    srv = FakeOpenAI()
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def make_engine(server, monkeypatch):
+    """Build an LLMEngine against the fake server with overridden settings."""
+    def factory(**overrides):
+        values = {
+            "OPENAI_API_KEY": "test-key",
+            "OPENAI_BASE_URL": server.base_url,
+            "LLM_DEADLINE_SECONDS": 5.0,
+            "LLM_MAX_RETRIES": 0,
+            "LLM_HEDGING_ENABLED": False,
+            "LLM_HEDGE_MIN_SAMPLES": 5,
+            "LLM_HEDGE_MIN_DELAY": 0.05,
+            "LLM_CIRCUIT_FAILURE_THRESHOLD": 2,
+            "LLM_CIRCUIT_RESET_SECONDS": 30.0,
+        }
+        values.update(overrides)
+        for name, value in values.items():
+            monkeypatch.setattr(settings, name, value)
+        return LLMEngine()
+    return factory
+
+
+def test_hedged_request_wins_when_primary_is_slow(server, make_engine):
+    engine = make_engine(LLM_HEDGING_ENABLED=True)
+    for _ in range(settings.LLM_HEDGE_MIN_SAMPLES):
+        answer, usage = engine.generate_answer_with_usage("Ki a dékán?", CONTEXT)
+        assert usage is not None
+
+    calls_before = server.calls
+    server.script = [(3.0, 200), (0.01, 200)]
+    started = time.monotonic()
+    answer, usage = engine.generate_answer_with_usage("Ki a dékán?", CONTEXT)
+
+    assert time.monotonic() - started < 1.5
+    assert answer == "answer after 0.01s"
+    assert usage["total_tokens"] == 14
+    assert engine.hedged_requests == 1
+    assert server.calls - calls_before == 2
+
+
+def test_deadline_exceeded_falls_back_to_retrieval_only_answer(server, make_engine):
+    engine = make_engine(LLM_DEADLINE_SECONDS=0.5)
+    server.script = [(3.0, 200)]
+    started = time.monotonic()
+    answer, usage = engine.generate_answer_with_usage("Ki a dékán?", CONTEXT, language="en")
+
+    assert time.monotonic() - started < 1.5
+    assert usage is None
+    assert "Kovács Anna" in answer
+    assert engine.fallbacks == 1
+
+
+def test_retries_stay_within_the_deadline(server, make_engine):
+    engine = make_engine(LLM_DEADLINE_SECONDS=0.6, LLM_MAX_RETRIES=5)
+    server.default = (0.4, 500)
+    answer, usage = engine.generate_answer_with_usage("Ki a dékán?", CONTEXT)
+    assert usage is None
+
+    # No attempt may start after the deadline in an abandoned thread
+    calls = server.calls
+    time.sleep(1.5)
+    assert server.calls == calls <= 2
+
+
+def test_retry_recovers_from_a_transient_error(server, make_engine):
+    engine = make_engine(LLM_MAX_RETRIES=1)
+    server.script = [(0.01, 503), (0.01, 200)]
+    answer, usage = engine.generate_answer_with_usage("Ki a dékán?", CONTEXT)
+
+    assert usage is not None
+    assert server.calls == 2
+    assert engine.breaker.state == "closed"
+
+
+def test_circuit_opens_after_repeated_5xx(server, make_engine):
+    engine = make_engine()
+    server.default = (0.01, 500)
+    for _ in range(settings.LLM_CIRCUIT_FAILURE_THRESHOLD):
+        _, usage = engine.generate_answer_with_usage("Ki a dékán?", CONTEXT)
+        assert usage is None
+    assert engine.breaker.state == "open"
+
+    # While open, requests are answered without contacting the upstream
+    calls = server.calls
+    answer, usage = engine.generate_answer_with_usage("Ki a dékán?", CONTEXT)
+    assert usage is None
+    assert "Kovács Anna" in answer
+    assert server.calls == calls
+
+
+def test_half_open_trial_success_closes_the_circuit(server, make_engine):
+    engine = make_engine(LLM_CIRCUIT_RESET_SECONDS=0.3)
+    server.default = (0.01, 500)
+    for _ in range(settings.LLM_CIRCUIT_FAILURE_THRESHOLD):
+        engine.generate_answer_with_usage("Ki a dékán?", CONTEXT)
+    assert engine.breaker.state == "open"
+
+    time.sleep(0.4)
+    assert engine.breaker.state == "half_open"
+    server.default = (0.01, 200)
+    answer, usage = engine.generate_answer_with_usage("Ki a dékán?", CONTEXT)
+
+    assert usage is not None
+    assert engine.breaker.state == "closed"
+
+
+def test_half_open_trial_failure_reopens_the_circuit(server, make_engine):
+    engine = make_engine(LLM_CIRCUIT_RESET_SECONDS=0.3)
+    server.default = (0.01, 500)
+    for _ in range(settings.LLM_CIRCUIT_FAILURE_THRESHOLD):
+        engine.generate_answer_with_usage("Ki a dékán?", CONTEXT)
+
+    time.sleep(0.4)
+    calls = server.calls
+    _, usage = engine.generate_answer_with_usage("Ki a dékán?", CONTEXT)
+    assert usage is None
+    assert server.calls == calls + 1
+    assert engine.breaker.state == "open"